@@ -17,12 +17,12 @@
 from enum import IntEnum
 from typing import List, Dict, Tuple, Optional
 
-from nmigen import Signal, Value, Elaboratable, Module, Cat, Const, Mux
+from nmigen import Signal, Value, Elaboratable, Module, Cat, Const, Mux, Array
 from nmigen import ClockDomain, ClockSignal
 from nmigen.build import Platform
 from nmigen.cli import main_parser, main_runner
 from nmigen.asserts import Assert, Assume
-from consts import Flags
+from consts import FLAG_N, FLAG_V, FLAG_B, FLAG_D, FLAG_I, FLAG_Z, FLAG_C
 
 
 class ALU8Func(IntEnum):
@@ -50,12 +50,113 @@ class ALU8Func(IntEnum):
     TR = 21
     LDSR = 22
 
+
+class ALU8Class(IntEnum):
+    """Functional classes of the ALU functions, each class computes
+    its own result which is then selected onto the output."""
+    NONE = 0
+    ARITH = 1
+    LOGIC = 2
+    SHIFT = 3
+    MOVE = 4
+
+
+ALU8_FUNC_CLASS: Dict[ALU8Func, ALU8Class] = {
+    ALU8Func.ADC: ALU8Class.ARITH,
+    ALU8Func.SBC: ALU8Class.ARITH,
+    ALU8Func.SUB: ALU8Class.ARITH,
+    ALU8Func.INC: ALU8Class.ARITH,
+    ALU8Func.DEC: ALU8Class.ARITH,
+    ALU8Func.ORA: ALU8Class.LOGIC,
+    ALU8Func.AND: ALU8Class.LOGIC,
+    ALU8Func.EOR: ALU8Class.LOGIC,
+    ALU8Func.ASL: ALU8Class.SHIFT,
+    ALU8Func.LSR: ALU8Class.SHIFT,
+    ALU8Func.ROL: ALU8Class.SHIFT,
+    ALU8Func.ROR: ALU8Class.SHIFT,
+    ALU8Func.LD: ALU8Class.MOVE,
+    ALU8Func.TR: ALU8Class.MOVE,
+}
+
+
+# Flag set/clear functions and the (flag, value) they write.
+ALU8_FLAG_FUNCS: Dict[ALU8Func, Tuple[int, int]] = {
+    ALU8Func.CLC: (FLAG_C, 0),
+    ALU8Func.SEC: (FLAG_C, 1),
+    ALU8Func.CLD: (FLAG_D, 0),
+    ALU8Func.SED: (FLAG_D, 1),
+    ALU8Func.CLI: (FLAG_I, 0),
+    ALU8Func.SEI: (FLAG_I, 1),
+    ALU8Func.CLV: (FLAG_V, 0),
+}
+
+
+# Decimal carry out of a nibble, indexed by the binary nibble sum.
+BCD_CARRY = [int(n >= 10) for n in range(16)]
+
+# Decimal adjust of a nibble, indexed by Cat(carry, sub, decimal).
+# ADC adds 6 on a carry, SBC adds 10 (subtracts 6) on a borrow.
+BCD_ADJUST = [0, 0, 0, 0, 0, 6, 10, 0]
+
+
+def prefix_add(m: Module, a: Value, b: Value, cin: Value) -> Tuple[Value, Value, List[Value]]:
+    """Kogge-Stone parallel-prefix adder.
+
+    The per-bit propagate and generate terms are placed in their own
+    signals so that constant operand bits fold away in synthesis.
+
+    Returns a tuple of (sum, carry_out, carries) where carries[i] is
+    the carry into bit i, so carries[0] is cin and carries[-1] is
+    carry_out.
+    """
+    width = len(a)
+
+    p = Signal(width)
+    g = Signal(width)
+    m.d.comb += p.eq(a ^ b)
+    m.d.comb += g.eq(a & b)
+
+    # p and g are the carry-save (sum, carry) pair of a and b, and cin
+    # is folded into bit 0 as a further generate term, so the prefix
+    # tree yields the carries directly.
+    # (G, P) o (G', P') = (G | P & G', P & P')
+    gs = [g[0] | (p[0] & cin)] + [g[i] for i in range(1, width)]
+    ps = [p[i] for i in range(width)]
+    dist = 1
+    while dist < width:
+        gs = [gs[i] | (ps[i] & gs[i - dist]) if i >= dist else gs[i]
+              for i in range(width)]
+        ps = [ps[i] & ps[i - dist] if i >= dist else ps[i]
+              for i in range(width)]
+        dist *= 2
+
+    carries = [cin] + gs
+    s = Cat(*[p[i] ^ carries[i] for i in range(width)])
+
+    return (s, carries[width], carries)
+
+
+def zero8(x: Value) -> Value:
+    """Zero test of an 8-bit value as a balanced OR tree over the nibbles."""
+    return ~(x[:4].bool() | x[4:8].bool())
+
+
 class ALU8(Elaboratable):
-    def __init__(self):
+    """8-bit ALU.
+
+    When pipelined, ADC/SBC/SUB register the adder results and take an
+    extra cycle. Their func and inputs must then be held until valid
+    goes high, and the flags are only written then.
+    """
+
+    def __init__(self, pipelined: bool = False):
+        self.pipelined = pipelined
+
         self.input1 = Signal(8)
         self.input2 = Signal(8)
         self.output = Signal(8)
         self.func = Signal(ALU8Func)
+        self.valid = Signal()
 
         # NV-BDIZC
         self.sr_flags = Signal(8, reset=0b00100000)
@@ -67,192 +168,219 @@ class ALU8(Elaboratable):
     def elaborate(self, platform: Platform) -> Module:
         m = Module()
 
-        m.d.comb += self._sr_flags.eq(self.sr_flags)
+        # each function drives the flags it writes into sr_new and marks
+        # them in sr_mask, the other flags keep their value
+        sr_new = Signal(8)
+        sr_mask = Signal(8)
+
+        m.d.comb += self._sr_flags.eq((self.sr_flags & ~sr_mask) | (sr_new & sr_mask))
         m.d.ph1 += self.sr_flags.eq(self._sr_flags)
 
+        # one-hot decoded function
+        func_1h = Signal(len(ALU8Func))
+        with m.Switch(self.func):
+            for func in ALU8Func:
+                with m.Case(func):
+                    m.d.comb += func_1h[func].eq(1)
+
         # intermediates
         half_carry = Signal()
         carry_out = Signal()
         overflow = Signal()
 
-        with m.Switch(self.func):
-            with m.Case(ALU8Func.LD):
-                m.d.comb += self.output.eq(self.input2)
-                m.d.comb += self._sr_flags[Flags.Z].eq(self.output == 0)
-                m.d.comb += self._sr_flags[Flags.N].eq(self.output[7])
-
-            # load without flags
-            with m.Case(ALU8Func.TR):
-                m.d.comb += self.output.eq(self.input2)
+        input2_n = Signal(8)
+        m.d.comb += input2_n.eq(~self.input2)
 
-            with m.Case(ALU8Func.LDSR):
-                m.d.comb += self._sr_flags.eq(self.input2)
+        # set by cases that take N and Z from the output
+        writes_nz = Signal()
 
-            with m.Case(ALU8Func.ADC):
-                carry_in = self.sr_flags[Flags.C]
-                decimal = self.sr_flags[Flags.D]
+        is_zero = Signal()
+        neg = Signal()
+        m.d.comb += is_zero.eq(zero8(self.output))
+        m.d.comb += neg.eq(self.output[7])
+
+        # ADC, SBC and SUB share a single adder, SBC and SUB add the
+        # inverted input2. SUB is a binary compare, so its carry in is
+        # forced to 1 and there is no decimal adjust.
+        sub = Signal()
+        compare = Signal()
+        carry_in = self.sr_flags[FLAG_C]
+        adder_cin = Signal()
+        decimal = Signal()
 
-                dec_hc = Signal() # decimal half carry
-                dec_co = Signal() # decimal carry out
+        addend = Signal(8)
 
-                res_hi = Signal(5)
-                res_lo = Signal(5)
+        dec_hc = Signal() # decimal half carry
+        dec_co = Signal() # decimal carry out
 
-                result = Cat(res_lo[:4], res_hi)
+        res_hi = Signal(5)
+        res_lo = Signal(5)
 
-                adj_hi = Signal(4)
-                adj_lo = Signal(4)
+        result = Cat(res_lo[:4], res_hi)
 
-                m.d.comb += dec_hc.eq(decimal & (res_lo[1:4] >= 5))
-                m.d.comb += dec_co.eq(decimal & (res_hi[1:4] >= 5))
+        adj_hi = Signal(4)
+        adj_lo = Signal(4)
 
-                # combined binary or decimal half carry
-                m.d.comb += half_carry.eq(res_lo[4] | dec_hc)
+        m.d.comb += compare.eq(func_1h[ALU8Func.SUB])
+        m.d.comb += sub.eq(func_1h[ALU8Func.SBC] | compare)
+        m.d.comb += adder_cin.eq(carry_in | compare)
+        m.d.comb += decimal.eq(self.sr_flags[FLAG_D] & ~compare)
+        m.d.comb += addend.eq(Mux(sub, input2_n, self.input2))
 
-                m.d.comb += res_lo.eq(self.input1[:4] + self.input2[:4] + carry_in)
-                m.d.comb += res_hi.eq(self.input1[4:8] + self.input2[4:8] + half_carry)
+        bcd_carry = Array(Const(c, 1) for c in BCD_CARRY)
+        bcd_adjust = Array(Const(a, 4) for a in BCD_ADJUST)
 
-                # combined binary or decimal carry out
-                m.d.comb += carry_out.eq(result[8] | dec_co)
+        m.d.comb += dec_hc.eq(decimal & bcd_carry[res_lo[:4]])
+        m.d.comb += dec_co.eq(decimal & bcd_carry[res_hi[:4]])
 
-                m.d.comb += overflow.eq(self.input1[7] ^ self.input2[7] ^ carry_out ^ result[7])
+        # combined binary or decimal half carry
+        m.d.comb += half_carry.eq(res_lo[4] | dec_hc)
 
-                m.d.comb += self._sr_flags[Flags.N].eq(result[7])
-                m.d.comb += self._sr_flags[Flags.Z].eq(result[:8] == 0)
-                m.d.comb += self._sr_flags[Flags.V].eq(overflow)
-                m.d.comb += self._sr_flags[Flags.C].eq(carry_out)
+        sum_lo, co_lo, _ = prefix_add(m, self.input1[:4], addend[:4], adder_cin)
+        sum_hi, co_hi, carries_hi = prefix_add(m, self.input1[4:8], addend[4:8], half_carry)
 
-                m.d.comb += adj_lo.eq(Mux(decimal & half_carry, 6, 0))
-                m.d.comb += adj_hi.eq(Mux(decimal & carry_out, 6, 0))
+        m.d.comb += res_lo.eq(Cat(sum_lo, co_lo))
+        m.d.comb += res_hi.eq(Cat(sum_hi, co_hi))
 
-                m.d.comb += self.output[:4].eq(result[:4] + adj_lo)
-                m.d.comb += self.output[4:8].eq(result[4:8] + adj_hi)
+        # combined binary or decimal carry out
+        m.d.comb += carry_out.eq(result[8] | dec_co)
 
-            with m.Case(ALU8Func.SBC):
-                carry_in = self.sr_flags[Flags.C]
-                decimal = self.sr_flags[Flags.D]
+        # carry into bit 7 xor carry out
+        m.d.comb += overflow.eq(carries_hi[3] ^ carry_out)
 
-                dec_hc = Signal() # decimal half carry
-                dec_co = Signal() # decimal carry out
+        adder_func = Signal()
+        m.d.comb += adder_func.eq(func_1h[ALU8Func.ADC] | sub)
 
-                res_hi = Signal(5)
-                res_lo = Signal(5)
+        if self.pipelined:
+            # the decimal adjust and flags work off registered adder results
+            res_lo_r = Signal(5)
+            res_hi_r = Signal(5)
+            half_carry_r = Signal()
+            carry_out_r = Signal()
+            overflow_r = Signal()
 
-                result = Cat(res_lo[:4], res_hi)
+            m.d.ph1 += res_lo_r.eq(res_lo)
+            m.d.ph1 += res_hi_r.eq(res_hi)
+            m.d.ph1 += half_carry_r.eq(half_carry)
+            m.d.ph1 += carry_out_r.eq(carry_out)
+            m.d.ph1 += overflow_r.eq(overflow)
 
-                adj_hi = Signal(4)
-                adj_lo = Signal(4)
+            result = Cat(res_lo_r[:4], res_hi_r)
+            half_carry = half_carry_r
+            carry_out = carry_out_r
+            overflow = overflow_r
 
-                m.d.comb += dec_hc.eq(decimal & (res_lo[1:4] >= 5))
-                m.d.comb += dec_co.eq(decimal & (res_hi[1:4] >= 5))
+            pending = Signal()
+            m.d.ph1 += pending.eq(adder_func & ~pending)
+            m.d.comb += self.valid.eq(~adder_func | pending)
+        else:
+            m.d.comb += self.valid.eq(1)
 
-                # combined binary or decimal half carry
-                m.d.comb += half_carry.eq(res_lo[4] | dec_hc)
+        m.d.comb += adj_lo.eq(bcd_adjust[Cat(half_carry, sub, decimal)])
+        m.d.comb += adj_hi.eq(bcd_adjust[Cat(carry_out, sub, decimal)])
 
-                m.d.comb += res_lo.eq(self.input1[:4] + ~self.input2[:4] + carry_in)
-                m.d.comb += res_hi.eq(self.input1[4:8] + ~self.input2[4:8] + half_carry)
+        # INC and DEC add a constant, so most of their P/G terms fold away
+        inc, _, _ = prefix_add(m, self.input1, Const(0x01, 8), 0)
+        dec, _, _ = prefix_add(m, self.input1, Const(0xFF, 8), 0)
 
-                # combined binary or decimal carry out
-                m.d.comb += carry_out.eq(result[8] | dec_co)
+        # ASL, LSR, ROL and ROR share a single 1-bit shifter, the rotates
+        # fill the vacated bit with the carry
+        shift_right = Signal()
+        shift_fill = Signal()
+        shifted = Signal(8)
+        shift_out = Signal()
+
+        m.d.comb += shift_right.eq(func_1h[ALU8Func.LSR] | func_1h[ALU8Func.ROR])
+        m.d.comb += shift_fill.eq((func_1h[ALU8Func.ROL] | func_1h[ALU8Func.ROR]) & carry_in)
+        m.d.comb += shifted.eq(Mux(shift_right,
+                                   Cat(self.input1[1:8], shift_fill),
+                                   Cat(shift_fill, self.input1[:7])))
+        m.d.comb += shift_out.eq(Mux(shift_right, self.input1[0], self.input1[7]))
+
+        arith_out = Signal(8)
+        logic_out = Signal(8)
+        class_sel = Signal(ALU8Class)
 
-                m.d.comb += overflow.eq(self.input1[7] ^ ~self.input2[7] ^ carry_out ^ result[7])
+        with m.Switch(self.func):
+            for cls in ALU8Class:
+                funcs = [f for f, c in ALU8_FUNC_CLASS.items() if c == cls]
+                if funcs:
+                    with m.Case(*funcs):
+                        m.d.comb += class_sel.eq(cls)
 
-                m.d.comb += self._sr_flags[Flags.N].eq(result[7])
-                m.d.comb += self._sr_flags[Flags.Z].eq(result[:8] == 0)
-                m.d.comb += self._sr_flags[Flags.V].eq(overflow)
-                m.d.comb += self._sr_flags[Flags.C].eq(carry_out)
+        # arithmetic
+        with m.Switch(self.func):
+            with m.Case(ALU8Func.ADC, ALU8Func.SBC):
+                with m.If(self.valid):
+                    m.d.comb += sr_new[FLAG_N].eq(result[7])
+                    m.d.comb += sr_mask[FLAG_N].eq(1)
+                    m.d.comb += sr_new[FLAG_Z].eq(zero8(result))
+                    m.d.comb += sr_mask[FLAG_Z].eq(1)
+                    m.d.comb += sr_new[FLAG_V].eq(overflow)
+                    m.d.comb += sr_mask[FLAG_V].eq(1)
+                    m.d.comb += sr_new[FLAG_C].eq(carry_out)
+                    m.d.comb += sr_mask[FLAG_C].eq(1)
+
+                m.d.comb += arith_out[:4].eq(result[:4] + adj_lo)
+                m.d.comb += arith_out[4:8].eq(result[4:8] + adj_hi)
 
-                m.d.comb += adj_lo.eq(Mux(decimal & ~half_carry, 10, 0))
-                m.d.comb += adj_hi.eq(Mux(decimal & ~carry_out, 10, 0))
+            with m.Case(ALU8Func.SUB):
+                m.d.comb += arith_out.eq(result[:8])
+                with m.If(self.valid):
+                    m.d.comb += writes_nz.eq(1)
+                    m.d.comb += sr_new[FLAG_C].eq(~carry_out)
+                    m.d.comb += sr_mask[FLAG_C].eq(1)
 
-                m.d.comb += self.output[:4].eq(result[:4] + adj_lo)
-                m.d.comb += self.output[4:8].eq(result[4:8] + adj_hi)
+            with m.Case(ALU8Func.INC):
+                m.d.comb += arith_out.eq(inc)
+                m.d.comb += writes_nz.eq(1)
 
-            with m.Case(ALU8Func.SUB):
-                carry7 = Signal()
-                carry8 = Signal()
-                sum0_6 = Cat(self.output[:7], carry7)
-                m.d.comb += sum0_6.eq(self.input1[:7] + ~self.input2[:7] + 1)
-                sum7 = Cat(self.output[7], carry8)
-                m.d.comb += sum7.eq(self.input1[7] + ~self.input2[7] + carry7)
-                m.d.comb += overflow.eq(carry7 ^ carry8)
-                m.d.comb += self._sr_flags[Flags.N].eq(self.output[7])
-                m.d.comb += self._sr_flags[Flags.Z].eq(self.output == 0)
-                m.d.comb += self._sr_flags[Flags.C].eq(~carry8)
+            with m.Case(ALU8Func.DEC):
+                m.d.comb += arith_out.eq(dec)
+                m.d.comb += writes_nz.eq(1)
 
+        # logical
+        with m.Switch(self.func):
             with m.Case(ALU8Func.ORA):
-                m.d.comb += self.output.eq(self.input1 | self.input2)
-                m.d.comb += self._sr_flags[Flags.N].eq(self.output[7])
-                m.d.comb += self._sr_flags[Flags.Z].eq(self.output == 0)
+                m.d.comb += logic_out.eq(self.input1 | self.input2)
 
             with m.Case(ALU8Func.AND):
-                m.d.comb += self.output.eq(self.input1 & self.input2)
-                m.d.comb += self._sr_flags[Flags.N].eq(self.output[7])
-                m.d.comb += self._sr_flags[Flags.Z].eq(self.output == 0)
+                m.d.comb += logic_out.eq(self.input1 & self.input2)
 
             with m.Case(ALU8Func.EOR):
-                m.d.comb += self.output.eq(self.input1 ^ self.input2)
-                m.d.comb += self._sr_flags[Flags.N].eq(self.output[7])
-                m.d.comb += self._sr_flags[Flags.Z].eq(self.output == 0)
-
-            with m.Case(ALU8Func.CLC):
-                m.d.comb += self._sr_flags[Flags.C].eq(0)
+                m.d.comb += logic_out.eq(self.input1 ^ self.input2)
 
-            with m.Case(ALU8Func.SEC):
-                m.d.comb += self._sr_flags[Flags.C].eq(1)
+        with m.If(class_sel == ALU8Class.LOGIC):
+            m.d.comb += writes_nz.eq(1)
 
-            with m.Case(ALU8Func.CLD):
-                m.d.comb += self._sr_flags[Flags.D].eq(0)
+        # shifts
+        with m.If(class_sel == ALU8Class.SHIFT):
+            m.d.comb += writes_nz.eq(1)
+            m.d.comb += sr_new[FLAG_C].eq(shift_out)
+            m.d.comb += sr_mask[FLAG_C].eq(1)
 
-            with m.Case(ALU8Func.SED):
-                m.d.comb += self._sr_flags[Flags.D].eq(1)
+        # moves, TR loads without flags
+        with m.If(func_1h[ALU8Func.LD]):
+            m.d.comb += writes_nz.eq(1)
 
-            with m.Case(ALU8Func.CLI):
-                m.d.comb += self._sr_flags[Flags.I].eq(0)
+        # status register
+        with m.If(func_1h[ALU8Func.LDSR]):
+            m.d.comb += sr_new.eq(self.input2)
+            m.d.comb += sr_mask.eq(0xFF)
 
-            with m.Case(ALU8Func.SEI):
-                m.d.comb += self._sr_flags[Flags.I].eq(1)
+        for func, (flag, value) in ALU8_FLAG_FUNCS.items():
+            with m.If(func_1h[func]):
+                m.d.comb += sr_new[flag].eq(value)
+                m.d.comb += sr_mask[flag].eq(1)
 
-            with m.Case(ALU8Func.CLV):
-                m.d.comb += self._sr_flags[Flags.V].eq(0)
+        class_out = Array([Const(0, 8), arith_out, logic_out, shifted, self.input2])
+        m.d.comb += self.output.eq(class_out[class_sel])
 
-            with m.Case(ALU8Func.INC):
-                m.d.comb += self.output.eq(self.input1 + 1)
-                m.d.comb += self._sr_flags[Flags.N].eq(self.output[7])
-                m.d.comb += self._sr_flags[Flags.Z].eq(self.output == 0)
-
-            with m.Case(ALU8Func.DEC):
-                m.d.comb += self.output.eq(self.input1 - 1)
-                m.d.comb += self._sr_flags[Flags.N].eq(self.output[7])
-                m.d.comb += self._sr_flags[Flags.Z].eq(self.output == 0)
-
-            with m.Case(ALU8Func.ASL):
-                m.d.comb += self.output.eq(Cat(0, self.input1[:7]))
-                m.d.comb += self._sr_flags[Flags.N].eq(self.output[7])
-                m.d.comb += self._sr_flags[Flags.Z].eq(self.output == 0)
-                m.d.comb += self._sr_flags[Flags.C].eq(self.input1[7])
-
-            with m.Case(ALU8Func.LSR):
-                m.d.comb += self.output.eq(Cat(self.input1[1:8], 0))
-                m.d.comb += self._sr_flags[Flags.N].eq(0)
-                m.d.comb += self._sr_flags[Flags.Z].eq(self.output == 0)
-                m.d.comb += self._sr_flags[Flags.C].eq(self.input1[0])
-
-            with m.Case(ALU8Func.ROL):
-                carry_in = self.sr_flags[Flags.C]
-
-                m.d.comb += self.output.eq(Cat(carry_in, self.input1[:7]))
-                m.d.comb += self._sr_flags[Flags.N].eq(self.output[7])
-                m.d.comb += self._sr_flags[Flags.Z].eq(self.output == 0)
-                m.d.comb += self._sr_flags[Flags.C].eq(self.input1[7])
-
-            with m.Case(ALU8Func.ROR):
-                carry_in = self.sr_flags[Flags.C]
-
-                m.d.comb += self.output.eq(Cat(self.input1[1:8], carry_in))
-                m.d.comb += self._sr_flags[Flags.N].eq(carry_in)
-                m.d.comb += self._sr_flags[Flags.Z].eq(self.output == 0)
-                m.d.comb += self._sr_flags[Flags.C].eq(self.input1[0])
+        with m.If(writes_nz):
+            m.d.comb += sr_new[FLAG_N].eq(neg)
+            m.d.comb += sr_mask[FLAG_N].eq(1)
+            m.d.comb += sr_new[FLAG_Z].eq(is_zero)
+            m.d.comb += sr_mask[FLAG_Z].eq(1)
 
         return m
 
@@ -276,14 +404,14 @@ if __name__ == "__main__":
 
     # NV-BDIZC
     m.d.comb += Assert(alu._sr_flags[5] == 1)
-    m.d.comb += Assert(alu._sr_flags[Flags.B] == 0)
-    m.d.comb += Assert(alu._sr_flags[Flags.D] == 0)
-    m.d.comb += Assert(alu._sr_flags[Flags.I] == 0)
+    m.d.comb += Assert(alu._sr_flags[FLAG_B] == 0)
+    m.d.comb += Assert(alu._sr_flags[FLAG_D] == 0)
+    m.d.comb += Assert(alu._sr_flags[FLAG_I] == 0)
 
     with m.Switch(alu.func):
         with m.Case(ALU8Func.ADC):
             # sumN = input1[:N] + input2[:N] (so sumN[N-1] is the carry bit)
-            m.d.comb += carry_in.eq(alu.sr_flags[Flags.C])
+            m.d.comb += carry_in.eq(alu.sr_flags[FLAG_C])
             h = sum5[4]
             n = sum9[7]
             c = sum9[8]
@@ -294,14 +422,14 @@ if __name__ == "__main__":
                 sum8.eq(alu.input1[:7] + alu.input2[:7] + carry_in),
                 sum5.eq(alu.input1[:4] + alu.input2[:4] + carry_in),
                 Assert(alu.output == sum9[:8]),
-                Assert(alu._sr_flags[Flags.N] == n),
-                Assert(alu._sr_flags[Flags.Z] == z),
-                Assert(alu._sr_flags[Flags.V] == v),
-                Assert(alu._sr_flags[Flags.C] == c),
-                Assert(alu._sr_flags[Flags.I] == alu.sr_flags[Flags.I]),
+                Assert(alu._sr_flags[FLAG_N] == n),
+                Assert(alu._sr_flags[FLAG_Z] == z),
+                Assert(alu._sr_flags[FLAG_V] == v),
+                Assert(alu._sr_flags[FLAG_C] == c),
+                Assert(alu._sr_flags[FLAG_I] == alu.sr_flags[FLAG_I]),
             ]
         with m.Case(ALU8Func.SBC):
-            m.d.comb += carry_in.eq(alu.sr_flags[Flags.C])
+            m.d.comb += carry_in.eq(alu.sr_flags[FLAG_C])
             n = sum9[7]
             c = ~sum9[8]
             z = (sum9[:8] == 0)
@@ -311,11 +439,11 @@ if __name__ == "__main__":
                 sum8.eq(alu.input1[:7] + ~alu.input2[:7] + ~carry_in),
                 Assert(sum9[:8] == (alu.input1 - alu.input2 - carry_in)[:8]),
                 Assert(alu.output == sum9[:8]),
-                Assert(alu._sr_flags[Flags.N] == n),
-                Assert(alu._sr_flags[Flags.Z] == z),
-                Assert(alu._sr_flags[Flags.V] == v),
-                Assert(alu._sr_flags[Flags.C] == c),
-                Assert(alu._sr_flags[Flags.I] == alu.sr_flags[Flags.I]),
+                Assert(alu._sr_flags[FLAG_N] == n),
+                Assert(alu._sr_flags[FLAG_Z] == z),
+                Assert(alu._sr_flags[FLAG_V] == v),
+                Assert(alu._sr_flags[FLAG_C] == c),
+                Assert(alu._sr_flags[FLAG_I] == alu.sr_flags[FLAG_I]),
             ]
 
     main_runner(parser, args, m, ports=alu.input_ports() + [ph1clk, rst])
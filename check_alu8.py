@@ -0,0 +1,108 @@
+# check_alu8.py: Checks the pipelined ALU8 against the single-cycle one
+# Copyright (C) 2021 M.Magomedov <mmagomedoff@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Runs ALU8(pipelined=True) and ALU8() side by side in pysim on random
+# functions and inputs. The pipelined ALU gets each operation held until
+# valid, the single-cycle one gets it only in that last cycle and NONE
+# before it. The outputs must agree when valid is set, and the flags
+# after every cycle, so the flags of the pipelined ALU must stay frozen
+# while an adder result is pending.
+
+import argparse
+import random
+import sys
+from typing import List
+
+from nmigen import Module, ClockDomain
+from nmigen.sim import Simulator, Settle
+
+from alu8 import ALU8, ALU8Func
+
+
+def check(seed: int, ops: int) -> List[str]:
+    """Runs the given number of random operations and returns the
+    mismatches found, stopping at the first one."""
+    m = Module()
+    m.submodules.piped = piped = ALU8(pipelined=True)
+    m.submodules.ref = ref = ALU8()
+    m.domains.ph1 = ClockDomain("ph1")
+
+    rnd = random.Random(seed)
+    funcs = list(ALU8Func)
+    errors = []
+
+    def process():
+        for op in range(ops):
+            func = rnd.choice(funcs)
+            input1 = rnd.getrandbits(8)
+            input2 = rnd.getrandbits(8)
+            where = f"seed {seed} op {op} {func.name} {input1:02X} {input2:02X}"
+
+            yield piped.func.eq(func)
+            yield piped.input1.eq(input1)
+            yield piped.input2.eq(input2)
+            yield ref.input1.eq(input1)
+            yield ref.input2.eq(input2)
+
+            for _ in range(2):
+                yield Settle()
+                valid = yield piped.valid
+                yield ref.func.eq(func if valid else ALU8Func.NONE)
+                yield Settle()
+
+                if valid:
+                    got = yield piped.output
+                    want = yield ref.output
+                    if got != want:
+                        errors.append(f"{where}: output {got:02X} want {want:02X}")
+
+                yield
+                yield Settle()
+
+                got = yield piped.sr_flags
+                want = yield ref.sr_flags
+                if got != want:
+                    errors.append(f"{where}: flags {got:08b} want {want:08b}")
+
+                if errors:
+                    return
+                if valid:
+                    break
+            else:
+                errors.append(f"{where}: valid never set")
+                return
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6, domain="ph1")
+    sim.add_sync_process(process, domain="ph1")
+    sim.run()
+
+    if not errors:
+        print(f"seed {seed}: {ops} operations agree")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks ALU8(pipelined=True) against ALU8()")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--ops", type=int, default=6000, help="operations to run")
+    args = parser.parse_args()
+
+    errors = check(args.seed, args.ops)
+    for error in errors:
+        print(error)
+
+    sys.exit(1 if errors else 0)
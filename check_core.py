@@ -0,0 +1,144 @@
+# check_core.py: Lock-step co-simulation of the core against model.py
+# Copyright (C) 2021 M.Magomedov <mmagomedoff@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Runs the Core in pysim on a random 64K memory image and steps the
+# reference model over its own copy of the image. At every instruction
+# boundary A, X, Y, SP, PC and SR, the cycles the instruction took and
+# the whole memory must agree. IRQ and NMI are held low, as the model
+# does not handle interrupts. When numba is installed the model runs
+# compiled, on the numpy arrays it expects.
+
+import argparse
+import random
+import sys
+from typing import List
+
+from nmigen import Module, ClockDomain
+from nmigen.sim import Simulator, Settle
+
+from core import Core
+import model
+
+try:
+    import numba  # noqa: F401
+    import numpy
+except ImportError:
+    numpy = None
+
+REGS = ("A", "X", "Y", "SP", "PC", "SR")
+
+
+def random_image(seed: int) -> bytearray:
+    """Returns a random 64K image that resets to 0x0200."""
+    rnd = random.Random(seed)
+    image = bytearray(rnd.getrandbits(8) for _ in range(0x10000))
+    image[0xFFFC] = 0x00
+    image[0xFFFD] = 0x02
+    return image
+
+
+def check(seed: int, cycles: int) -> List[str]:
+    """Co-simulates for the given number of cycles and returns the
+    mismatches found, stopping at the first one."""
+    core = Core()
+    m = Module()
+    m.submodules.core = core
+    m.domains.ph1 = ClockDomain("ph1")
+
+    mem = random_image(seed)
+    if numpy is None:
+        model_mem = bytearray(mem)
+        rom = model.build_rom()
+        state = [0] * model.STATE_SIZE
+    else:
+        model_mem = numpy.frombuffer(mem, dtype=numpy.uint8).copy()
+        rom = numpy.array(model.build_rom(), dtype=numpy.int64)
+        state = numpy.zeros(model.STATE_SIZE, dtype=numpy.int64)
+    errors = []
+    last = None  # cycle of the last boundary
+    instrs = 0
+
+    def compare(cycle: int):
+        nonlocal last, instrs
+        regs = []
+        for s in (core.a, core.x, core.y, core.sp, core.pc, core.sr_flags):
+            regs.append((yield s))
+
+        if last is None:
+            state[:] = regs
+        else:
+            opcode = model_mem[state[model.PC]]
+            want = model.step(state, model_mem, rom)
+            where = f"seed {seed} cycle {cycle} opcode {opcode:02X}"
+            for name, got, exp in zip(REGS, regs, state):
+                if got != exp:
+                    errors.append(f"{where}: {name} core {got:02X} model {exp:02X}")
+            if cycle - last != want:
+                errors.append(f"{where}: cycles core {cycle - last} model {want}")
+            if mem != bytes(model_mem):
+                addr = next(a for a in range(0x10000) if mem[a] != model_mem[a])
+                errors.append(f"{where}: memory at {addr:04X} core {mem[addr]:02X} "
+                              f"model {model_mem[addr]:02X}")
+            instrs += 1
+        last = cycle
+
+    def process():
+        yield Settle()
+        for cycle in range(cycles):
+            addr = yield core.Addr
+            write = not (yield core.RW)
+            dout = yield core.Dout
+            yield core.Din.eq(mem[addr])
+            yield Settle()
+
+            # the opcode fetch cycle of an instruction that is not an interrupt
+            if ((yield core.reset_oh) == 0b1000 and (yield core.cycle_oh) == 1
+                    and not (yield core.interrupt)):
+                yield from compare(cycle)
+                if errors:
+                    return
+
+            if write:
+                mem[addr] = dout
+            yield
+            yield Settle()
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6, domain="ph1")
+    sim.add_sync_process(process, domain="ph1")
+    sim.run()
+
+    if not errors:
+        print(f"seed {seed}: {instrs} instructions agree")
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Co-simulates the core against model.py")
+    parser.add_argument("--seed", type=int, default=1, help="first random image seed")
+    parser.add_argument("--seeds", type=int, default=4, help="number of images to run")
+    parser.add_argument("--cycles", type=int, default=3000, help="cycles to run per image")
+    args = parser.parse_args()
+
+    print("model compiled with numba" if numpy is not None else "model in plain Python")
+
+    failed = False
+    for seed in range(args.seed, args.seed + args.seeds):
+        for error in check(seed, args.cycles):
+            print(error)
+            failed = True
+
+    sys.exit(1 if failed else 0)
@@ -38,3 +38,7 @@ class Flags(IntEnum):
     I = 2 # Interrupt (IRQ disable)
     Z = 1 # Zero
     C = 0 # Carry
+
+
+# Flag positions as plain ints, avoids enum lookups while elaborating.
+FLAG_N, FLAG_V, FLAG_B, FLAG_D, FLAG_I, FLAG_Z, FLAG_C = 7, 6, 4, 3, 2, 1, 0
@@ -16,21 +16,21 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from enum import IntEnum
-from typing import List, Dict, Tuple, Optional
+from typing import List, Tuple, Optional
 import importlib
 
-from nmigen import Const, Signal, Elaboratable, Module, Cat, Mux, Value, unsigned
+from nmigen import Const, Signal, Elaboratable, Module, Cat, Mux, Repl, Value, Array, Shape, unsigned
 from nmigen import ClockDomain, ClockSignal # , ResetSignal
 from nmigen.build import Platform
 from nmigen.hdl.ast import Statement
 from nmigen.asserts import Assert, Past, Cover, Assume
 from nmigen.cli import main_parser, main_runner
-from nmigen.sim import Simulator
+from nmigen.sim import Simulator, Settle, Tick
 # from nmigen.back.pysim import Simulator #, Delay
 
 from formal.verification import FormalData, Verification
 from alu8 import ALU8Func, ALU8
-from consts import AddressModes, Flags
+from consts import AddressModes, FLAG_N, FLAG_V, FLAG_I, FLAG_Z, FLAG_C
 
 
 class Reg8(IntEnum):
@@ -60,13 +60,253 @@ class Reg16(IntEnum):
     ADDR = 3
 
 
+class Handler(IntEnum):
+    """Instruction handlers the opcode decoder selects from.
+    Handlers that only differ by the registers they work on
+    get their own value."""
+    ILLEGAL = 0
+    BRK = 1
+    RTI = 2
+    NOP = 3
+    FLAG = 4
+    JMP = 5
+    BR = 6
+    JSR = 7
+    RTS = 8
+    PHA = 9
+    PHP = 10
+    PLA = 11
+    PLP = 12
+    TAX = 13
+    TAY = 14
+    TSX = 15
+    TXA = 16
+    TXS = 17
+    TYA = 18
+    INC_DEC_X = 19
+    INC_DEC_Y = 20
+    STA = 21
+    STX = 22
+    STY = 23
+    ALU2 = 24
+    ALU_IMP_X = 25
+    ALU_IMP_Y = 26
+    ALU_A = 27
+    ALU_X = 28
+    ALU_Y = 29
+
+
+class OperandMode(IntEnum):
+    """Addressing mode helpers the shared operand fetch logic runs
+    for an instruction. NONE means the handler does its own
+    addressing."""
+    NONE = 0
+    IMMEDIATE = 1
+    ZEROPAGE = 2
+    ABSOLUTE = 3
+    INDIRECT_X = 4
+    INDIRECT_Y = 5
+    INDIRECT = 6
+    ABSOLUTE_INDEXED = 7
+
+
+# Operand fetch per addressing mode (bits 4, 3 and 2) for the handlers
+# which use the shared addressing mode helpers.
+STORE_OPERANDS = {
+    AddressModes.ZEROPAGE: OperandMode.ZEROPAGE,
+    AddressModes.ABSOLUTE: OperandMode.ABSOLUTE,
+    AddressModes.ABSOLUTE_X: OperandMode.ABSOLUTE,
+    AddressModes.ABSOLUTE_Y: OperandMode.ABSOLUTE,
+    AddressModes.INDIRECT_X: OperandMode.INDIRECT_X,
+}
+ALU_OPERANDS = {
+    AddressModes.INDIRECT_X: OperandMode.INDIRECT_X,
+    AddressModes.ZEROPAGE: OperandMode.ZEROPAGE,
+    AddressModes.IMMEDIATE: OperandMode.IMMEDIATE,
+    AddressModes.ABSOLUTE: OperandMode.ABSOLUTE,
+    AddressModes.INDIRECT_Y: OperandMode.INDIRECT_Y,
+    AddressModes.ABSOLUTE_X: OperandMode.ABSOLUTE_INDEXED,
+    AddressModes.ABSOLUTE_Y: OperandMode.ABSOLUTE_INDEXED,
+}
+ALU2_OPERANDS = {
+    AddressModes.ZEROPAGE: OperandMode.ZEROPAGE,
+    AddressModes.ABSOLUTE: OperandMode.ABSOLUTE,
+}
+HANDLER_OPERANDS = {
+    Handler.STA: STORE_OPERANDS,
+    Handler.STX: STORE_OPERANDS,
+    Handler.STY: STORE_OPERANDS,
+    Handler.ALU_A: ALU_OPERANDS,
+    Handler.ALU_X: ALU_OPERANDS,
+    Handler.ALU_Y: ALU_OPERANDS,
+    Handler.ALU2: ALU2_OPERANDS,
+}
+
+
+# Opcode patterns in priority order: (patterns, handler, ALU function, store).
+# A pattern is either an opcode or a string where - matches any bit.
+OPCODES: List[Tuple[Tuple, Handler, ALU8Func, bool]] = [
+    ((0x00,), Handler.BRK, ALU8Func.NONE, False),
+    ((0x40,), Handler.RTI, ALU8Func.NONE, False),
+    ((0xEA,), Handler.NOP, ALU8Func.NONE, False),
+    ((0x18,), Handler.FLAG, ALU8Func.CLC, False),
+    ((0x38,), Handler.FLAG, ALU8Func.SEC, False),
+    ((0x58,), Handler.FLAG, ALU8Func.CLI, False),
+    ((0x78,), Handler.FLAG, ALU8Func.SEI, False),
+    ((0xB8,), Handler.FLAG, ALU8Func.CLV, False),
+    ((0xD8,), Handler.FLAG, ALU8Func.CLD, False),
+    ((0xF8,), Handler.FLAG, ALU8Func.SED, False),
+    (("01-01100",), Handler.JMP, ALU8Func.NONE, False),
+    (("---10000",), Handler.BR, ALU8Func.NONE, False),
+    ((0x20,), Handler.JSR, ALU8Func.NONE, False),
+    ((0x60,), Handler.RTS, ALU8Func.NONE, False),
+    ((0x48,), Handler.PHA, ALU8Func.NONE, False),
+    ((0x08,), Handler.PHP, ALU8Func.NONE, False),
+    ((0x68,), Handler.PLA, ALU8Func.LD, True),
+    ((0x28,), Handler.PLP, ALU8Func.LDSR, False),
+    ((0xAA,), Handler.TAX, ALU8Func.LD, True),
+    ((0xA8,), Handler.TAY, ALU8Func.LD, True),
+    ((0xBA,), Handler.TSX, ALU8Func.LD, True),
+    ((0x8A,), Handler.TXA, ALU8Func.LD, True),
+    ((0x9A,), Handler.TXS, ALU8Func.TR, True),
+    ((0x98,), Handler.TYA, ALU8Func.LD, True),
+    ((0xE8,), Handler.INC_DEC_X, ALU8Func.INC, True),  # INX
+    ((0xC8,), Handler.INC_DEC_Y, ALU8Func.INC, True),  # INY
+    ((0xCA,), Handler.INC_DEC_X, ALU8Func.DEC, True),  # DEX
+    ((0x88,), Handler.INC_DEC_Y, ALU8Func.DEC, True),  # DEY
+    ((0x85, 0x95, 0x8D, 0x9D, 0x99, 0x81, 0x91), Handler.STA, ALU8Func.NONE, False),
+    ((0x86, 0x96, 0x8E), Handler.STX, ALU8Func.NONE, False),
+    ((0x84, 0x94, 0x8C), Handler.STY, ALU8Func.NONE, False),
+    ((0xE6, 0xEE, 0xF6, 0xFE), Handler.ALU2, ALU8Func.INC, True),
+    ((0xC6, 0xCE, 0xD6, 0xDE), Handler.ALU2, ALU8Func.DEC, True),
+    ((0x0A, 0x06, 0x16, 0x0E, 0x1E), Handler.ALU2, ALU8Func.ASL, True),
+    ((0x2A, 0x26, 0x36, 0x2E, 0x3E), Handler.ALU2, ALU8Func.ROL, True),
+    ((0x4A, 0x46, 0x56, 0x4E, 0x5E), Handler.ALU2, ALU8Func.LSR, True),
+    ((0x6A, 0x66, 0x76, 0x6E, 0x7E), Handler.ALU2, ALU8Func.ROR, True),
+    ((0xE0,), Handler.ALU_IMP_X, ALU8Func.SUB, False),  # CPX imm
+    ((0xE4, 0xEC), Handler.ALU_X, ALU8Func.SUB, False),  # CPX
+    ((0xC0,), Handler.ALU_IMP_Y, ALU8Func.SUB, False),  # CPY imm
+    ((0xC4, 0xCC), Handler.ALU_Y, ALU8Func.SUB, False),  # CPY
+    ((0xA2,), Handler.ALU_IMP_X, ALU8Func.LD, True),  # LDX imm
+    ((0xA0,), Handler.ALU_IMP_Y, ALU8Func.LD, True),  # LDY imm
+    ((0xA6, 0xB6, 0xAE, 0xBE), Handler.ALU_X, ALU8Func.LD, True),  # LDX
+    ((0xA4, 0xB4, 0xAC, 0xBC), Handler.ALU_Y, ALU8Func.LD, True),  # LDY
+    (("101---01",), Handler.ALU_A, ALU8Func.LD, True),
+    (("011---01",), Handler.ALU_A, ALU8Func.ADC, True),
+    (("111---01",), Handler.ALU_A, ALU8Func.SBC, True),
+    (("000---01",), Handler.ALU_A, ALU8Func.ORA, True),
+    (("001---01",), Handler.ALU_A, ALU8Func.AND, True),
+    (("010---01",), Handler.ALU_A, ALU8Func.EOR, True),
+    (("0010-100",), Handler.ALU_A, ALU8Func.AND, False),  # BIT
+    (("110---01",), Handler.ALU_A, ALU8Func.SUB, False),  # CMP
+]
+
+
+def decode_operand(handler: Handler, opcode: int) -> OperandMode:
+    """Returns the operand fetch for the opcode run by the given handler."""
+    if handler in (Handler.BR, Handler.ALU_IMP_X, Handler.ALU_IMP_Y):
+        return OperandMode.IMMEDIATE
+    if handler == Handler.JMP:
+        return OperandMode.INDIRECT if opcode & 0x20 else OperandMode.ABSOLUTE
+    mode = AddressModes((opcode >> 2) & 0x07)
+    return HANDLER_OPERANDS.get(handler, {}).get(mode, OperandMode.NONE)
+
+
+def pattern_mask(pattern) -> Tuple[int, int]:
+    """Returns the (value, mask) pair an opcode pattern matches."""
+    if isinstance(pattern, str):
+        value = int(pattern.replace("-", "0"), 2)
+        mask = int("".join("0" if p == "-" else "1" for p in pattern), 2)
+        return value, mask
+    return pattern, 0xFF
+
+
+# OPCODES compiled to (value, mask, handler, ALU function, store), in the same order.
+OP_TABLE: List[Tuple[int, int, Handler, ALU8Func, bool]] = [
+    (*pattern_mask(pattern), handler, func, store)
+    for patterns, handler, func, store in OPCODES
+    for pattern in patterns
+]
+
+
+def decode_opcode(opcode: int) -> Tuple[Handler, ALU8Func, bool, OperandMode]:
+    """Returns the handler, ALU function, store flag and operand fetch
+    for the opcode."""
+    for value, mask, handler, func, store in OP_TABLE:
+        if opcode & mask == value:
+            return handler, func, store, decode_operand(handler, opcode)
+    return Handler.ILLEGAL, ALU8Func.NONE, False, OperandMode.NONE
+
+
+# Decoded opcodes, indexed by opcode.
+DECODED = [decode_opcode(opcode) for opcode in range(256)]
+
+# Cycles of the longest instructions (BRK, read-modify-write absolute,X)
+# and of the interrupt sequence.
+MAX_CYCLES = 7
+
+
 class Core(Elaboratable):
     """The core of the CPU. There is another layer wich
     handles I/O for the actual pins.
     """
 
-    reg8_map: Dict[IntEnum, Tuple[Signal, bool]]
-    reg16_map: Dict[IntEnum, Tuple[Signal, bool]]
+    reg8_map: Tuple[Optional[Tuple[Signal, bool]], ...]
+    reg16_map: Tuple[Optional[Tuple[Signal, bool]], ...]
+
+    # (register, attribute, writable) for the register maps
+    _REG8_LAYOUT = (
+        (Reg8.A, "a", True),
+        (Reg8.X, "x", True),
+        (Reg8.Y, "y", True),
+        (Reg8.SP, "sp", True),
+        (Reg8.PCH, "pch", True),
+        (Reg8.PCL, "pcl", True),
+        (Reg8.TMP8, "tmp8", True),
+        (Reg8.TMP16H, "tmp16h", True),
+        (Reg8.TMP16L, "tmp16l", True),
+        (Reg8.DIN, "Din", False),  # read-only register
+        (Reg8.DOUT, "Dout", True),
+    )
+    _REG16_LAYOUT = (
+        (Reg16.PC, "pc", True),
+        (Reg16.TMP16, "tmp16", True),
+        (Reg16.ADDR, "Addr", True),
+    )
+
+    # handler -> (method, keyword arguments). Argument values name a Core
+    # attribute, or the decoded "func" and "store" signals.
+    _HANDLER_TABLE = {
+        Handler.BRK: ("BRK", {}),
+        Handler.RTI: ("RTI", {}),
+        Handler.NOP: ("NOP", {}),
+        Handler.FLAG: ("FLAG", {"func": "func"}),
+        Handler.JMP: ("JMP", {}),
+        Handler.BR: ("BR", {}),
+        Handler.JSR: ("JSR", {}),
+        Handler.RTS: ("RTS", {}),
+        Handler.PHA: ("PUSH", {"register": "a"}),
+        Handler.PHP: ("PUSH", {"register": "sr_flags"}),
+        Handler.PLA: ("PULL", {"func": "func", "register": "a"}),
+        Handler.PLP: ("PULL", {"func": "func"}),
+        Handler.TAX: ("TR", {"func": "func", "input": "a", "output": "x"}),
+        Handler.TAY: ("TR", {"func": "func", "input": "a", "output": "y"}),
+        Handler.TSX: ("TR", {"func": "func", "input": "sp", "output": "x"}),
+        Handler.TXA: ("TR", {"func": "func", "input": "x", "output": "a"}),
+        Handler.TXS: ("TR", {"func": "func", "input": "x", "output": "sp"}),
+        Handler.TYA: ("TR", {"func": "func", "input": "y", "output": "a"}),
+        Handler.INC_DEC_X: ("INC_DEC_IND", {"func": "func", "index": "x"}),
+        Handler.INC_DEC_Y: ("INC_DEC_IND", {"func": "func", "index": "y"}),
+        Handler.STA: ("ST", {"src": "a", "index": "x"}),
+        Handler.STX: ("ST", {"src": "x", "index": "y"}),
+        Handler.STY: ("ST", {"src": "y", "index": "x"}),
+        Handler.ALU2: ("ALU2", {"func": "func"}),
+        Handler.ALU_IMP_X: ("ALU_IMP", {"func": "func", "output": "x", "store": "store"}),
+        Handler.ALU_IMP_Y: ("ALU_IMP", {"func": "func", "output": "y", "store": "store"}),
+        Handler.ALU_A: ("ALU", {"func": "func", "x_index": "x", "output": "a", "store": "store"}),
+        Handler.ALU_X: ("ALU", {"func": "func", "x_index": "y", "output": "x", "store": "store"}),
+        Handler.ALU_Y: ("ALU", {"func": "func", "x_index": "x", "output": "y", "store": "store"}),
+    }
 
     def __init__(self, verification: Verification = None):
         # outputs
@@ -105,45 +345,49 @@ class Core(Elaboratable):
         self.alu8 = Signal(8)   # Output from the ALU
         self.sr_flags = Signal(8)
 
-        # selectors for busses
-        self.src8_1_select = Signal(Reg8)
-        self.src8_2_select = Signal(Reg8)
-
         # function control
         self.alu8_func = Signal(ALU8Func)
 
-        self.reg8_map = {
-            Reg8.A: (self.a, True),
-            Reg8.X: (self.x, True),
-            Reg8.Y: (self.y, True),
-            Reg8.SP: (self.sp, True),
-            Reg8.PCH: (self.pch, True),
-            Reg8.PCL: (self.pcl, True),
-            Reg8.TMP8: (self.tmp8, True),
-            Reg8.TMP16H: (self.tmp16h, True),
-            Reg8.TMP16L: (self.tmp16l, True),
-            Reg8.DIN: (self.Din, False),  # read-only register
-            Reg8.DOUT: (self.Dout, True),
-        }
-        self.reg16_map = {
-            Reg16.PC: (self.pc, True),
-            Reg16.TMP16: (self.tmp16, True),
-            Reg16.ADDR: (self.Addr, True),
-        }
+        # (signal, writable) indexed by the Reg8/Reg16 value, None for NONE
+        self.reg8_map = self.reg_table(Reg8, self._REG8_LAYOUT)
+        self.reg16_map = self.reg_table(Reg16, self._REG16_LAYOUT)
+
+        # opcode decode, one 256-entry ROM built from DECODED whose words
+        # pack Cat(handler, func, store, amode)
+        hw, fw, aw = (Shape.cast(e).width for e in (Handler, ALU8Func, OperandMode))
+        self.decode_rom = Array(
+            Const(h | (f << hw) | (st << (hw + fw)) | (a << (hw + fw + 1)), hw + fw + 1 + aw)
+            for h, f, st, a in DECODED)
 
         # internal state
-        self.reset_state = Signal(2)  # where we are during reset
-        self.cycle = Signal(4)        # where we are during instr processing
+        self.reset_oh = Signal(4, reset=1)  # where we are during reset, one-hot
+        self.cycle_oh = Signal(MAX_CYCLES, reset=1)  # where we are during instr processing, one-hot
         self.interrupt = Signal()
         # NMI    : $FFFA-$FFFB
         # RESET  : $FFFC-$FFFD
         # IRQ/BRK: $FFFE-$FFFF
         self.interrupt_vec = Signal(2)
 
-        # page boundary crossed
-        self.sum9 = Signal(9)
+        # indexed address low byte and page boundary crossed, from the one
+        # base + index adder shared by the indexed addressing modes and the
+        # branches. The base is tmp16l unless a branch adds to pcl.
+        self.index_base = Signal(8)
+        self.index = Signal(8)
         self.addr_ind = Signal(8)
         self.overflow = Signal()
+        self.adh_next = Signal(8)  # tmp16h, carried into when overflowed
+
+        # zero page pointer high byte address, shared by the indirect modes
+        self.tmp8_p1 = Signal(8)
+
+        # pc + 1, shared by the operand fetches and the pushes of the pc
+        self.pc_p1 = Signal(16)
+
+        # operand fetch
+        self.amode = Signal(OperandMode)
+        self.operand = Signal(16)
+        self.value = Signal(8)
+        self.indexed_done = Signal()  # an indexed mode's operand is on Din
 
         # mode bits
         self.mode_a = Signal(3)
@@ -155,7 +399,7 @@ class Core(Elaboratable):
 
         # Formal verification
         self.verification = verification
-        self.formalData = FormalData(verification)
+        self.formalData = FormalData(verification) if verification is not None else None
 
     def ports(self) -> List[Signal]:
         return [self.Addr, self.Din, self.Dout, self.RW, self.RDY, self.IRQ, self.NMI]
@@ -166,10 +410,11 @@ class Core(Elaboratable):
         m.submodules.alu = alu = ALU8()
 
         m.d.comb += self.end_instr_flag.eq(0)
-        m.d.comb += self.src8_1_select.eq(Reg8.NONE)
-        m.d.comb += self.src8_2_select.eq(Reg8.NONE)
+        m.d.comb += self.end_instr_addr.eq(self.pc)
         m.d.comb += self.alu8_func.eq(ALU8Func.NONE)
-        m.d.ph1 += self.cycle.eq(self.cycle + 1)
+        m.d.ph1 += self.cycle_oh.eq(self.cycle_oh.rotate_left(1))
+        # every cycle reads unless it is a write cycle
+        m.d.ph1 += self.RW.eq(1)
 
         # 76543210
         # aaabbbcc
@@ -177,8 +422,9 @@ class Core(Elaboratable):
         m.d.comb += self.mode_b.eq(self.instr[2:5])
         m.d.comb += self.mode_c.eq(self.instr[0:2])
 
-        self.src_bus_setup(m, self.reg8_map, self.src8_1, self.src8_1_select)
-        self.src_bus_setup(m, self.reg8_map, self.src8_2, self.src8_2_select)
+        # the ALU inputs are driven by the handlers, zero when not driven
+        m.d.comb += self.src8_1.eq(0)
+        m.d.comb += self.src8_2.eq(0)
 
         m.d.comb += alu.input1.eq(self.src8_1)
         m.d.comb += alu.input2.eq(self.src8_2)
@@ -187,35 +433,36 @@ class Core(Elaboratable):
         m.d.comb += self.sr_flags.eq(alu.sr_flags)
 
         # addressing
-        m.d.comb += self.addr_ind.eq(self.sum9[:8])
-        m.d.comb += self.overflow.eq(self.sum9[8])
+        m.d.comb += self.tmp8_p1.eq(self.tmp8 + 1)
+        m.d.comb += self.pc_p1.eq(self.pc + 1)
+        m.d.comb += self.index_base.eq(self.tmp16l)
+        m.d.comb += Cat(self.addr_ind, self.overflow).eq(self.index_base + self.index)
+        m.d.comb += self.adh_next.eq(self.tmp16h + self.overflow)
 
         self.reset_handler(m)
-        with m.If(self.reset_state == 3):
+        with m.If(self.reset_oh[3]):
             with m.If(self.interrupt):
                 self.interrupt_handler(m)
-            with m.Elif(self.cycle == 0):
+            with m.Elif(self.at(0)):
                 self.fetch(m)
             with m.Else():
                 self.execute(m)
-        self.maybe_do_formal_verification(m)
+        if self.verification is not None:
+            self.formal_verification(m)
         self.end_instr_flag_handler(m)
 
         return m
 
-    def src_bus_setup(self, m: Module, reg_map: Dict[IntEnum, Tuple[Signal, bool]], bus: Signal, selector: Signal):
-        with m.Switch(selector):
-            for e, reg in reg_map.items():
-                with m.Case(e):
-                    m.d.comb += bus.eq(reg[0])
-            with m.Default():
-                m.d.comb += bus.eq(0)
+    def reg_table(self, regs, layout) -> Tuple[Optional[Tuple[Signal, bool]], ...]:
+        """Returns the layout as a tuple indexed by register value."""
+        table = [None] * (max(regs) + 1)
+        for e, name, writable in layout:
+            table[e] = (getattr(self, name), writable)
+        return tuple(table)
 
-    def dest_bus_setup(self, m: Module, reg_map: Dict[IntEnum, Tuple[Signal, bool]], bus: Signal, bitmap: Signal):
-        for e, reg in reg_map.items():
-            if reg[1]:
-                with m.If(bitmap[e.value]):
-                    m.d.ph1 += reg[0].eq(bus)
+    def at(self, cycle: int) -> Value:
+        """Returns the bit that is set during the given cycle of an instruction."""
+        return self.cycle_oh[cycle]
 
     def read_byte(self, m: Module, cycle: int, addr: Statement,
                   comb_dest: Signal = None, sync_dest: Signal = None):
@@ -223,329 +470,268 @@ class Core(Elaboratable):
 
         The byte read is combinatorically placed in comb_dest.
         """
-        with m.If(self.cycle == cycle):
+        with m.If(self.at(cycle)):
             m.d.ph1 += self.Addr.eq(addr)
-            m.d.ph1 += self.RW.eq(1)
 
-        with m.If(self.cycle == cycle + 1):
+        with m.If(self.at(cycle + 1)):
             if comb_dest is not None:
                 m.d.comb += comb_dest.eq(self.Din)
             if sync_dest is not None:
                 m.d.ph1 += sync_dest.eq(self.Din)
 
+    def read_zeropage(self, m: Module, addr: Value):
+        """Reads the zero page byte at the 8-bit addr in the next cycle."""
+        m.d.ph1 += self.Addr.eq(Cat(addr[:8], Const(0, 8)))
+
+    def address_stack(self, m: Module, offset: int = 0):
+        """Addresses the stack byte at sp + offset in the next cycle."""
+        m.d.ph1 += self.Addr.eq(Cat((self.sp + offset)[:8], Const(1, 8)))
+
+    def store_tail(self, m: Module, cycle: int, addr: Statement, data: Statement):
+        """Writes data to addr starting from the given cycle.
+
+        The instruction ends in the following cycle.
+        """
+        with m.If(self.at(cycle)):
+            m.d.ph1 += self.Addr.eq(addr)
+            m.d.ph1 += self.Dout.eq(data)
+            m.d.ph1 += self.RW.eq(0)
+
+        with m.If(self.at(cycle + 1)):
+            self.end_instr(m)
+
     def fetch(self, m: Module):
         m.d.ph1 += self.instr.eq(self.Din)
-        m.d.ph1 += self.RW.eq(1)
-        m.d.ph1 += self.pc.eq(self.pc + 1)
-        m.d.ph1 += self.Addr.eq(self.pc + 1)
+        m.d.ph1 += self.pc.eq(self.pc_p1)
+        m.d.ph1 += self.Addr.eq(self.pc_p1)
 
-    def end_instr(self, m: Module, addr: Statement):
+    def end_instr(self, m: Module, addr: Statement = None):
         """Ends the instruction.
 
-        Loads the PC and Addr register with the given addr, sets R/W mode
-        to read, and sets the cycle to 0 at the end of the current cycle.
+        Loads the PC and Addr register with the given addr, or the current
+        PC if none is given, sets R/W mode to read, and sets the cycle to 0
+        at the end of the current cycle. The opcode fetch thus overlaps the
+        last cycle of the instruction, and fetch() latches it from Din while
+        addressing the next byte.
         """
-        m.d.comb += self.end_instr_addr.eq(addr)
+        if addr is not None:
+            m.d.comb += self.end_instr_addr.eq(addr)
         m.d.comb += self.end_instr_flag.eq(1)
 
     def execute(self, m: Module):
-        with m.Switch(self.instr):
-            with m.Case(0x00):
-                self.BRK(m)
-            with m.Case(0x40):
-                self.RTI(m)
-            with m.Case(0xEA):
-                self.NOP(m)
-            with m.Case("00-11000"):
-                self.CL_SE_C(m)
-            with m.Case("11-11000"):
-                self.CL_SE_D(m)
-            with m.Case("01-11000"):
-                self.CL_SE_I(m)
-            with m.Case("10111000"):
-                self.CLV(m)
-            with m.Case("01-01100"):
-                self.JMP(m)
-            with m.Case("---10000"):
-                self.BR(m)
-            with m.Case(0x20):
-                self.JSR(m) # JSR
-            with m.Case(0x60):
-                self.RTS(m)
-            with m.Case(0x48):
-                self.PUSH(m, register=self.a) # PHA
-            with m.Case(0x08):
-                self.PUSH(m, register=self.sr_flags) # PHP
-            with m.Case(0x68):
-                self.PULL(m, func=ALU8Func.LD, register=self.a) # PLA
-            with m.Case(0x28):
-                self.PULL(m, func=ALU8Func.LDSR) # PLP
-            with m.Case(0xAA):
-                self.TR(m, func=ALU8Func.LD, input=self.a, output=self.x) # TAX
-            with m.Case(0xA8):
-                self.TR(m, func=ALU8Func.LD, input=self.a, output=self.y) # TAY
-            with m.Case(0xBA):
-                self.TR(m, func=ALU8Func.LD, input=self.sp, output=self.x) # TSX
-            with m.Case(0x8A):
-                self.TR(m, func=ALU8Func.LD, input=self.x, output=self.a) # TXA
-            with m.Case(0x9A):
-                self.TR(m, func=ALU8Func.TR, input=self.x, output=self.sp) # TXS
-            with m.Case(0x98):
-                self.TR(m, func=ALU8Func.LD, input=self.y, output=self.a) # TYA
-            with m.Case(0xE8):
-                self.INC_DEC_IND(m, func=ALU8Func.INC, index=self.x) # INX
-            with m.Case(0xC8):
-                self.INC_DEC_IND(m, func=ALU8Func.INC, index=self.y) # INY
-            with m.Case(0xCA):
-                self.INC_DEC_IND(m, func=ALU8Func.DEC, index=self.x) # DEX
-            with m.Case(0x88):
-                self.INC_DEC_IND(m, func=ALU8Func.DEC, index=self.y) # DEY
-            with m.Case(0x85, 0x95, 0x8D, 0x9D, 0x99, 0x81, 0x91):
-                self.ST(m) # STA
-            with m.Case(0x86, 0x96, 0x8E):
-                self.ST(m) # STX
-            with m.Case(0x84, 0x94, 0x8C):
-                self.ST(m) # STY
-            with m.Case(0xE6, 0xEE, 0xF6, 0xFE):
-                self.ALU2(m, func=ALU8Func.INC)
-            with m.Case(0xC6, 0xCE, 0xD6, 0xDE):
-                self.ALU2(m, func=ALU8Func.DEC)
-            with m.Case(0x0A, 0x06, 0x16, 0x0E, 0x1E):
-                self.ALU2(m, func=ALU8Func.ASL)
-            with m.Case(0x2A, 0x26, 0x36, 0x2E, 0x3E):
-                self.ALU2(m, func=ALU8Func.ROL)
-            with m.Case(0x4A, 0x46, 0x56, 0x4E, 0x5E):
-                self.ALU2(m, func=ALU8Func.LSR)
-            with m.Case(0x6A, 0x66, 0x76, 0x6E, 0x7E):
-                self.ALU2(m, func=ALU8Func.ROR)
-            with m.Case(0xE0):
-                self.ALU_IMP(m, func=ALU8Func.SUB, output=self.x, store=False) # CPX imm
-            with m.Case(0xE4, 0xEC):
-                self.ALU(m, func=ALU8Func.SUB, x_index=self.x, output=self.x, store=False) # CPX
-            with m.Case(0xC0):
-                self.ALU_IMP(m, func=ALU8Func.SUB, output=self.y, store=False) # CPY imm
-            with m.Case(0xC4, 0xCC):
-                self.ALU(m, func=ALU8Func.SUB, x_index=self.x, output=self.y, store=False) # CPY
-            with m.Case(0xA2):
-                self.ALU_IMP(m, func=ALU8Func.LD, output=self.x) # LDX imm
-            with m.Case(0xA0):
-                self.ALU_IMP(m, func=ALU8Func.LD, output=self.y) # LDY imm
-            with m.Case(0xA6, 0xB6, 0xAE, 0xBE):
-                self.ALU(m, ALU8Func.LD, x_index=self.y, output=self.x) # LDX
-            with m.Case(0xA4, 0xB4, 0xAC, 0xBC):
-                self.ALU(m, ALU8Func.LD, x_index=self.x, output=self.y) # LDY
-            with m.Case("101---01"):
-                self.ALU(m, ALU8Func.LD, x_index=self.x, output=self.a)
-            with m.Case("011---01"):
-                self.ALU(m, ALU8Func.ADC, x_index=self.x, output=self.a)
-            with m.Case("111---01"):
-                self.ALU(m, ALU8Func.SBC, x_index=self.x, output=self.a)
-            with m.Case("000---01"):
-                self.ALU(m, ALU8Func.ORA, x_index=self.x, output=self.a)
-            with m.Case("001---01"):
-                self.ALU(m, ALU8Func.AND, x_index=self.x, output=self.a)
-            with m.Case("010---01"):
-                self.ALU(m, ALU8Func.EOR, x_index=self.x, output=self.a)
-            with m.Case("0010-100"): # BIT
-                self.ALU(m, ALU8Func.AND, x_index=self.x, output=self.a, store=False)
-            with m.Case("110---01"): # CMP
-                self.ALU(m, ALU8Func.SUB, x_index=self.x, output=self.a, store=False)
+        handler = Signal(Handler)
+        func = Signal(ALU8Func)
+        store = Signal()
+        m.d.comb += Cat(handler, func, store, self.amode).eq(self.decode_rom[self.instr])
+
+        # must come before the handlers, which override Addr and RW
+        self.operand_fetch(m)
+
+        # signals the handler arguments can name besides Core attributes
+        signals = {"func": func, "store": store}
+
+        with m.Switch(handler):
+            for h, (method, kwargs) in self._HANDLER_TABLE.items():
+                with m.Case(h):
+                    getattr(self, method)(m, **{k: signals[v] if v in signals else getattr(self, v)
+                                                for k, v in kwargs.items()})
             with m.Default():  # Illegal
-                self.end_instr(m, self.pc)
+                self.end_instr(m)
+
+    def operand_fetch(self, m: Module):
+        """Generates the addressing mode logic selected by amode.
+
+        The addressing mode helpers are instantiated once here instead of
+        in every handler. Their operand is placed in self.operand, and for
+        (indirect,X) the byte read through the operand in self.value.
+        """
+        with m.Switch(self.amode):
+            with m.Case(OperandMode.IMMEDIATE):
+                m.d.comb += self.operand.eq(self.mode_immediate(m))
+            with m.Case(OperandMode.ZEROPAGE):
+                m.d.comb += self.operand.eq(self.mode_zeropage(m))
+            with m.Case(OperandMode.ABSOLUTE, OperandMode.INDIRECT):
+                # JMP ($hhll) fetches its pointer like an absolute operand
+                pointer = self.mode_absolute(m)
+                with m.If(self.amode == OperandMode.ABSOLUTE):
+                    m.d.comb += self.operand.eq(pointer)
+                with m.Else():
+                    m.d.comb += self.operand.eq(self.mode_indirect(m, pointer))
+            with m.Case(OperandMode.INDIRECT_X):
+                operand, value = self.mode_indirect_x(m)
+                m.d.comb += self.operand.eq(operand)
+                m.d.comb += self.value.eq(value)
+            with m.Case(OperandMode.INDIRECT_Y):
+                m.d.comb += self.operand.eq(self.mode_indirect_y(m))
+            with m.Case(OperandMode.ABSOLUTE_INDEXED):
+                m.d.comb += self.operand.eq(self.mode_absolute_indexed(m))
 
     def reset_handler(self, m: Module):
-        with m.Switch(self.reset_state):
-            with m.Case(0):
-                m.d.ph1 += self.Addr.eq(0xFFFC)
-                m.d.ph1 += self.RW.eq(1)
-                m.d.ph1 += self.reset_state.eq(1)
-            with m.Case(1):
-                m.d.ph1 += self.Addr.eq(0xFFFD)
-                m.d.ph1 += self.RW.eq(1)
-                m.d.ph1 += self.tmp8.eq(self.Din)
-                m.d.ph1 += self.reset_state.eq(2)
-            with m.Case(2):
-                m.d.ph1 += self.reset_state.eq(3)
-                reset_vec = Cat(self.tmp8, self.Din)
-                self.end_instr(m, reset_vec)
+        with m.If(~self.reset_oh[3]):
+            m.d.ph1 += self.reset_oh.eq(self.reset_oh << 1)
+
+        with m.If(self.reset_oh[0] | self.reset_oh[1]):
+            # the vector at 0xFFFC, low byte first
+            m.d.ph1 += self.Addr.eq(Cat(self.reset_oh[1], Const(0xFFFC >> 1, 15)))
+        with m.If(self.reset_oh[1]):
+            m.d.ph1 += self.tmp8.eq(self.Din)
+        with m.If(self.reset_oh[2]):
+            reset_vec = Cat(self.tmp8, self.Din)
+            self.end_instr(m, reset_vec)
 
     def interrupt_handler(self, m: Module):
-        with m.If(self.cycle == 1):
-            m.d.ph1 += self.pc.eq(self.pc + 1)
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp)
-            m.d.ph1 += self.Dout.eq((self.pc + 1)[8:]) # store PCH
+        with m.If(self.at(1)):
+            m.d.ph1 += self.pc.eq(self.pc_p1)
+            self.address_stack(m)
+            m.d.ph1 += self.Dout.eq(self.pc_p1[8:]) # store PCH
             m.d.ph1 += self.RW.eq(0)
 
-        with m.If(self.cycle == 2):
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp - 1)
+        with m.If(self.at(2)):
+            self.address_stack(m, -1)
             m.d.ph1 += self.Dout.eq(self.pcl) # store PCL
             m.d.ph1 += self.RW.eq(0)
 
-        with m.If(self.cycle == 3):
+        with m.If(self.at(3)):
             with m.If(self.interrupt_vec == 2): # unless NMI
                 m.d.comb += self.alu8_func.eq(ALU8Func.SEI)
 
             m.d.ph1 += self.sp.eq(self.sp - 3)
 
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp - 2)
+            self.address_stack(m, -2)
             m.d.ph1 += self.Dout.eq(self.sr_flags)
             m.d.ph1 += self.RW.eq(0)
 
-        with m.If(self.cycle == 4):
+        with m.If(self.at(4)):
             m.d.ph1 += self.Addr.eq(0xFFFA | (self.interrupt_vec << 1))
-            m.d.ph1 += self.RW.eq(1)
 
-        with m.If(self.cycle == 5):
+        with m.If(self.at(5)):
             m.d.ph1 += self.pcl.eq(self.Din) # fetch low byte
             m.d.ph1 += self.Addr.eq(self.Addr + 1)
-            m.d.ph1 += self.RW.eq(1)
 
-        with m.If(self.cycle == 6):
+        with m.If(self.at(6)):
             m.d.ph1 += self.pch.eq(self.Din) # fetch high byte
             self.end_instr(m, Cat(self.pcl, self.Din))
 
     def end_instr_flag_handler(self, m: Module):
         with m.If(self.end_instr_flag):
             m.d.ph1 += self.pc.eq(self.end_instr_addr)
-            m.d.ph1 += self.cycle.eq(0)
+            m.d.ph1 += self.cycle_oh.eq(1)
 
             with m.If(self.NMI):
                 m.d.ph1 += self.interrupt.eq(1)
                 m.d.ph1 += self.interrupt_vec.eq(0)
-            with m.Elif(self.IRQ & ~self.sr_flags[Flags.I]):
+            with m.Elif(self.IRQ & ~self.sr_flags[FLAG_I]):
                 m.d.ph1 += self.interrupt.eq(1)
                 m.d.ph1 += self.interrupt_vec.eq(2)
             with m.Else():
                 m.d.ph1 += self.interrupt.eq(0)
                 m.d.ph1 += self.interrupt_vec.eq(0)
-                m.d.ph1 += self.pc.eq(self.end_instr_addr)
+                # the next opcode is read during cycle 0
                 m.d.ph1 += self.Addr.eq(self.end_instr_addr)
-                m.d.ph1 += self.RW.eq(1)
 
-    def maybe_do_formal_verification(self, m: Module):
-        if self.verification is not None:
-            with m.If((self.cycle == 0) & (self.reset_state == 3)):
+    def formal_verification(self, m: Module):
+        """Snapshots and verifies instructions, only elaborated when
+        the core is built with a verification."""
+        with m.If(self.at(0) & self.reset_oh[3]):
 
-                with m.If(self.verification.valid(self.Din) & (~self.interrupt)):
-                    m.d.ph1 += self.formalData.preSnapshot(
-                        m, self.Din, self.sr_flags, self.a, self.x, self.y, self.sp, self.pc)
-                with m.Else():
-                    m.d.ph1 += self.formalData.noSnapshot(m)
+            with m.If(self.verification.valid(self.Din) & (~self.interrupt)):
+                m.d.ph1 += self.formalData.preSnapshot(
+                    m, self.Din, self.sr_flags, self.a, self.x, self.y, self.sp, self.pc)
+            with m.Else():
+                m.d.ph1 += self.formalData.noSnapshot(m)
 
-                with m.If(self.formalData.snapshot_taken):
-                    m.d.comb += self.formalData.postSnapshot(
-                        m, self.sr_flags, self.a, self.x, self.y, self.sp, self.pc)
-                    self.verification.verify(m, self.instr, self.formalData)
+            with m.If(self.formalData.snapshot_taken):
+                m.d.comb += self.formalData.postSnapshot(
+                    m, self.sr_flags, self.a, self.x, self.y, self.sp, self.pc)
+                self.verification.verify(m, self.instr, self.formalData)
 
-            with m.Elif(self.formalData.snapshot_taken):
-                m.d.ph1 += self.formalData.snapshot_signals(
-                    m, addr=self.Addr, din=self.Din, dout=self.Dout, rw=self.RW,
-                    irq=self.IRQ, nmi=self.NMI)
+        with m.Elif(self.formalData.snapshot_taken):
+            m.d.ph1 += self.formalData.snapshot_signals(
+                m, addr=self.Addr, din=self.Din, dout=self.Dout, rw=self.RW,
+                irq=self.IRQ, nmi=self.NMI)
 
     def NOP(self, m: Module):
-        self.end_instr(m, self.pc)
+        self.end_instr(m)
 
     def BRK(self, m: Module):
-        with m.If(self.cycle == 1):
-            m.d.ph1 += self.pc.eq(self.pc + 1)
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp)
-            m.d.ph1 += self.Dout.eq((self.pc + 1)[8:]) # store PCH
+        with m.If(self.at(1)):
+            m.d.ph1 += self.pc.eq(self.pc_p1)
+            self.address_stack(m)
+            m.d.ph1 += self.Dout.eq(self.pc_p1[8:]) # store PCH
             m.d.ph1 += self.RW.eq(0)
 
-        with m.If(self.cycle == 2):
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp - 1)
+        with m.If(self.at(2)):
+            self.address_stack(m, -1)
             m.d.ph1 += self.Dout.eq(self.pcl) # store PCL
             m.d.ph1 += self.RW.eq(0)
 
-        with m.If(self.cycle == 3):
+        with m.If(self.at(3)):
             m.d.comb += self.alu8_func.eq(ALU8Func.SEI)
 
             m.d.ph1 += self.sp.eq(self.sp - 3)
 
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp - 2)
+            self.address_stack(m, -2)
             m.d.ph1 += self.Dout.eq(self.sr_flags | 0x30) # store SR with B = 1 (00110000)
             m.d.ph1 += self.RW.eq(0)
 
-        with m.If(self.cycle == 4):
+        with m.If(self.at(4)):
             m.d.ph1 += self.Addr.eq(0xFFFE)
-            m.d.ph1 += self.RW.eq(1)
 
-        with m.If(self.cycle == 5):
+        with m.If(self.at(5)):
             m.d.ph1 += self.pcl.eq(self.Din) # fetch FFFE
 
             m.d.ph1 += self.Addr.eq(0xFFFF)
-            m.d.ph1 += self.RW.eq(1)
 
-        with m.If(self.cycle == 6):
+        with m.If(self.at(6)):
             m.d.ph1 += self.pch.eq(self.Din) # fetch FFFF
 
             self.end_instr(m, Cat(self.pcl, self.Din))
 
     def RTI(self, m: Module):
-        with m.If(self.cycle == 1):
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp)
-            m.d.ph1 += self.RW.eq(1)
-            m.d.ph1 += self.pc.eq(self.pc + 1)
-
-        with m.If(self.cycle == 2):
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp + 1)
-            m.d.ph1 += self.RW.eq(1)
-
-        with m.If(self.cycle == 3):
+        with m.If(self.at(1)):
+            self.address_stack(m)
+            m.d.ph1 += self.pc.eq(self.pc_p1)
+
+        with m.If(self.at(2)):
+            self.address_stack(m, 1)
+
+        with m.If(self.at(3)):
             # load sr flags from stack
-            m.d.comb += self.src8_1.eq(0)
             m.d.comb += self.src8_2.eq(self.Din)
             m.d.comb += self.alu8_func.eq(ALU8Func.LDSR)
 
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp + 2)
-            m.d.ph1 += self.RW.eq(1)
+            self.address_stack(m, 2)
 
-        with m.If(self.cycle == 4):
+        with m.If(self.at(4)):
             m.d.ph1 += self.pcl.eq(self.Din) # fetch pcl
 
             m.d.ph1 += self.sp.eq(self.sp + 3)
 
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp + 3)
-            m.d.ph1 += self.RW.eq(1)
+            self.address_stack(m, 3)
 
-        with m.If(self.cycle == 5):
+        with m.If(self.at(5)):
             m.d.ph1 += self.pch.eq(self.Din) # fetch pch
             self.end_instr(m, Cat(self.pcl, self.Din))
 
     def JSR(self, m: Module):
-        with m.If(self.cycle == 1):
-            m.d.ph1 += self.pc.eq(self.pc + 1)
+        with m.If(self.at(1)):
+            m.d.ph1 += self.pc.eq(self.pc_p1)
             m.d.ph1 += self.tmp16l.eq(self.Din) # fetch low address
-            m.d.ph1 += self.Addr.eq(self.pc + 1)
-            m.d.ph1 += self.RW.eq(1)
+            m.d.ph1 += self.Addr.eq(self.pc_p1)
 
-        with m.If(self.cycle == 2):
+        with m.If(self.at(2)):
             m.d.ph1 += self.tmp16h.eq(self.Din) # fetch high address
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp)
-            m.d.ph1 += self.RW.eq(1)
+            self.address_stack(m)
 
-        with m.If(self.cycle == 3):
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp)
+        with m.If(self.at(3)):
+            self.address_stack(m)
             m.d.ph1 += self.Dout.eq(self.pch)
             m.d.ph1 += self.RW.eq(0)
 
             m.d.ph1 += self.sp.eq(self.sp - 1)
 
-        with m.If(self.cycle == 4):
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp)
+        with m.If(self.at(4)):
+            self.address_stack(m)
             m.d.ph1 += self.Dout.eq(self.pcl)
             m.d.ph1 += self.RW.eq(0)
 
@@ -553,610 +739,441 @@ class Core(Elaboratable):
 
             m.d.ph1 += self.pc.eq(self.tmp16)
 
-        with m.If(self.cycle == 5):
-            self.end_instr(m, self.pc)
+        with m.If(self.at(5)):
+            self.end_instr(m)
 
 
     def RTS(self, m: Module):
-        with m.If(self.cycle == 1):
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp)
-            m.d.ph1 += self.RW.eq(1)
-            m.d.ph1 += self.pc.eq(self.pc + 1)
-
-        with m.If(self.cycle == 2):
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp + 1)
-            m.d.ph1 += self.RW.eq(1)
-
-        with m.If(self.cycle == 3):
+        with m.If(self.at(1)):
+            self.address_stack(m)
+            m.d.ph1 += self.pc.eq(self.pc_p1)
+
+        with m.If(self.at(2)):
+            self.address_stack(m, 1)
+
+        with m.If(self.at(3)):
             m.d.ph1 += self.pcl.eq(self.Din)
             m.d.ph1 += self.sp.eq(self.sp + 2)
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp + 2)
-            m.d.ph1 += self.RW.eq(1)
+            self.address_stack(m, 2)
 
-        with m.If(self.cycle == 4):
+        with m.If(self.at(4)):
             m.d.ph1 += self.pch.eq(self.Din)
 
-        with m.If(self.cycle == 5):
-            self.end_instr(m, self.pc)
+        with m.If(self.at(5)):
+            self.end_instr(m)
 
     def PUSH(self, m: Module, register: Value):
-        with m.If(self.cycle == 1):
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp)
+        with m.If(self.at(1)):
+            self.address_stack(m)
             m.d.ph1 += self.sp.eq(self.sp - 1)
             m.d.ph1 += self.RW.eq(0)
             m.d.ph1 += self.Dout.eq(register)
 
-        with m.If(self.cycle == 2):
-            self.end_instr(m, self.pc)
+        with m.If(self.at(2)):
+            self.end_instr(m)
 
-    def PULL(self, m: Module, func: ALU8Func, register: Statement = None):
-        with m.If(self.cycle == 1):
+    def PULL(self, m: Module, func: Value, register: Statement = None):
+        with m.If(self.at(1)):
             pass
 
-        with m.If(self.cycle == 2):
-            m.d.ph1 += self.adh.eq(0x01)
-            m.d.ph1 += self.adl.eq(self.sp + 1)
-            m.d.ph1 += self.RW.eq(1)
+        with m.If(self.at(2)):
+            self.address_stack(m, 1)
 
             m.d.ph1 += self.sp.eq(self.sp + 1)
 
-        with m.If(self.cycle == 3):
-            m.d.comb += self.src8_1.eq(0)
+        with m.If(self.at(3)):
             m.d.comb += self.src8_2.eq(self.Din)
             m.d.comb += self.alu8_func.eq(func)
 
             if register is not None:
                 m.d.ph1 += register.eq(self.alu8)
 
-            self.end_instr(m, self.pc)
+            self.end_instr(m)
 
-    def INC_DEC_IND(self, m: Module, func: ALU8Func, index: Statement):
-        with m.If(self.cycle == 1):
+    def INC_DEC_IND(self, m: Module, func: Value, index: Statement):
+        with m.If(self.at(1)):
             m.d.comb += self.src8_1.eq(index)
-            m.d.comb += self.src8_2.eq(0)
             m.d.comb += self.alu8_func.eq(func)
             m.d.ph1 += index.eq(self.alu8)
 
-            self.end_instr(m, self.pc)
-
-    def ST(self, m: Module):
-        index = Signal(8)
-        zp_ind = Signal(8)
-
-        with m.Switch(self.mode_c):
-            with m.Case("01"):
-                m.d.comb += index.eq(self.a)
-                m.d.comb += zp_ind.eq(self.x)
-            with m.Case("10"):
-                m.d.comb += index.eq(self.x)
-                m.d.comb += zp_ind.eq(self.y)
-            with m.Case("00"):
-                m.d.comb += index.eq(self.y)
-                m.d.comb += zp_ind.eq(self.x)
-            with m.Default():
-                m.d.comb += index.eq(self.a)
-                m.d.comb += zp_ind.eq(self.x)
+            self.end_instr(m)
 
-        with m.If(self.mode_b == AddressModes.ZEROPAGE.value):
-            operand = self.mode_zeropage(m)
+    def ST(self, m: Module, src: Statement, index: Statement):
+        """Stores src to memory (STA, STX, STY).
 
-            with m.If(self.cycle == 1):
-                m.d.ph1 += self.Addr.eq(operand)
-                m.d.ph1 += self.Dout.eq(index)
-                m.d.ph1 += self.RW.eq(0)
+        index is the register added to the zero page address in the
+        zeropage indexed mode: Y for STX, X for STA and STY.
+        """
 
-            with m.If(self.cycle == 2):
-                self.end_instr(m, self.pc)
+        # effective address of the ABSOLUTE_X, ABSOLUTE_Y and INDIRECT_Y modes
+        eff_addr = Signal(16)
+        m.d.comb += self.index.eq(Mux(self.mode_b == AddressModes.ABSOLUTE_X.value,
+                                      self.x, self.y))
+        m.d.comb += eff_addr.eq(Cat(self.addr_ind, self.adh_next))
 
-        with m.Elif(self.mode_b == AddressModes.ZEROPAGE_IND.value):
-            with m.If(self.cycle == 1):
-                m.d.ph1 += self.tmp8.eq(self.Din)
-                m.d.ph1 += self.pc.eq(self.pc + 1)
-                m.d.ph1 += self.Addr.eq(self.Din)
-                m.d.ph1 += self.RW.eq(1)
+        with m.Switch(self.mode_b):
+            with m.Case(AddressModes.ZEROPAGE.value):
+                self.store_tail(m, cycle=1, addr=self.operand, data=src)
 
-            with m.If(self.cycle == 2):
-                m.d.ph1 += self.adl.eq(self.tmp8 + zp_ind)
-                m.d.ph1 += self.adh.eq(0)
-                m.d.ph1 += self.RW.eq(0)
-                m.d.ph1 += self.Dout.eq(index)
+            with m.Case(AddressModes.ZEROPAGE_IND.value):
+                with m.If(self.at(1)):
+                    m.d.ph1 += self.tmp8.eq(self.Din)
+                    m.d.ph1 += self.pc.eq(self.pc_p1)
+                    m.d.ph1 += self.Addr.eq(self.Din)
 
-            with m.If(self.cycle == 3):
-                self.end_instr(m, self.pc)
+                self.store_tail(m, cycle=2, addr=Cat((self.tmp8 + index)[:8], Const(0, 8)), data=src)
 
-        with m.Elif(self.mode_b == AddressModes.ABSOLUTE.value):
-            operand = self.mode_absolute(m)
+            with m.Case(AddressModes.ABSOLUTE.value):
+                self.store_tail(m, cycle=2, addr=self.operand, data=src)
 
-            with m.If(self.cycle == 2):
-                m.d.ph1 += self.Addr.eq(operand)
-                m.d.ph1 += self.Dout.eq(index)
-                m.d.ph1 += self.RW.eq(0)
+            with m.Case(AddressModes.ABSOLUTE_X.value, AddressModes.ABSOLUTE_Y.value):
+                with m.If(self.at(2)):
+                    m.d.ph1 += self.adl.eq(self.addr_ind)
+                    m.d.ph1 += self.adh.eq(self.Din) # high byte
 
-            with m.If(self.cycle == 3):
-                self.end_instr(m, self.pc)
+                self.store_tail(m, cycle=3, addr=eff_addr, data=src)
 
-        with m.Elif(self.mode_b == AddressModes.ABSOLUTE_X.value):
-            operand = self.mode_absolute(m)
+            with m.Case(AddressModes.INDIRECT_X.value):
+                self.store_tail(m, cycle=4, addr=self.operand, data=src)
 
-            sum9 = Signal(9)
+            with m.Case(AddressModes.INDIRECT_Y.value):
+                with m.If(self.at(1)):
+                    m.d.ph1 += self.tmp8.eq(self.Din)
+                    m.d.ph1 += self.pc.eq(self.pc_p1)
 
-            m.d.comb += sum9.eq(self.tmp16l + self.x)
+                    self.read_zeropage(m, self.Din)
 
-            with m.If(self.cycle == 2):
-                m.d.ph1 += self.adl.eq(sum9[:8])
-                m.d.ph1 += self.adh.eq(self.Din) # high byte
-                m.d.ph1 += self.RW.eq(1)
+                with m.If(self.at(2)):
+                    m.d.ph1 += self.tmp16l.eq(self.Din)
+                    self.read_zeropage(m, self.tmp8_p1)
 
-            with m.If(self.cycle == 3):
-                m.d.ph1 += self.adl.eq(sum9[:8])
-                m.d.ph1 += self.adh.eq(self.tmp16h + sum9[8])
-                m.d.ph1 += self.Dout.eq(self.a)
-                m.d.ph1 += self.RW.eq(0)
+                with m.If(self.at(3)):
+                    m.d.ph1 += self.tmp16h.eq(self.Din)
+                    m.d.ph1 += self.Addr.eq(Cat(self.addr_ind, self.Din))
 
-            with m.If(self.cycle == 4):
-                self.end_instr(m, self.pc)
+                self.store_tail(m, cycle=4, addr=eff_addr, data=src)
 
-        with m.Elif(self.mode_b == AddressModes.ABSOLUTE_Y.value):
-            operand = self.mode_absolute(m)
+            with m.Default():
+                pass
 
-            sum9 = Signal(9)
+    def JMP(self, m: Module):
+        # 0b01001100: 0x4C jmp $hhll
+        # 0b01101100: 0x6C jmp ($hhll)
 
-            m.d.comb += sum9.eq(self.tmp16l + self.y)
+        with m.Switch(self.mode_a):
+            with m.Case(2):
+                with m.If(self.at(2)):
+                    self.end_instr(m, self.operand)
 
-            with m.If(self.cycle == 2):
-                m.d.ph1 += self.adl.eq(sum9[:8])
-                m.d.ph1 += self.adh.eq(self.Din) # high byte
-                m.d.ph1 += self.RW.eq(1)
+            with m.Case(3):
+                with m.If(self.at(4)):
+                    self.end_instr(m, self.operand)
 
-            with m.If(self.cycle == 3):
-                m.d.ph1 += self.adl.eq(sum9[:8])
-                m.d.ph1 += self.adh.eq(self.tmp16h + sum9[8])
-                m.d.ph1 += self.Dout.eq(self.a)
-                m.d.ph1 += self.RW.eq(0)
+    def TR(self, m: Module, func: Value, input: Statement, output: Statement):
+        with m.If(self.at(1)):
+            m.d.comb += self.src8_1.eq(output)
+            m.d.comb += self.src8_2.eq(input)
+            m.d.comb += self.alu8_func.eq(func)
 
-            with m.If(self.cycle == 4):
-                self.end_instr(m, self.pc)
+            m.d.ph1 += output.eq(self.alu8)
 
-        with m.Elif(self.mode_b == AddressModes.INDIRECT_X.value):
-            operand, value = self.mode_indirect_x(m)
+            self.end_instr(m)
 
-            with m.If(self.cycle == 4):
-                m.d.ph1 += self.Addr.eq(operand)
-                m.d.ph1 += self.Dout.eq(self.a)
-                m.d.ph1 += self.RW.eq(0)
+    def ALU_IMP(self, m, func: Value, output: Statement, store: Value):
+        with m.If(self.at(1)):
+            m.d.comb += self.src8_1.eq(output)
+            m.d.comb += self.src8_2.eq(self.operand)
+            m.d.comb += self.alu8_func.eq(func)
 
-            with m.If(self.cycle == 5):
-                self.end_instr(m, self.pc)
+            with m.If(store):
+                m.d.ph1 += output.eq(self.alu8)
 
-        with m.Elif(self.mode_b == AddressModes.INDIRECT_Y.value):
-            addr_ind = self.tmp16l + self.y
+            self.end_instr(m, self.pc_p1)
 
-            with m.If(self.cycle == 1):
-                m.d.ph1 += self.tmp8.eq(self.Din)
-                m.d.ph1 += self.pc.eq(self.pc + 1)
+    def ALU(self, m: Module, func: Value, x_index: Statement, output: Statement, store: Value):
+        with m.Switch(self.mode_b):
+            with m.Case(AddressModes.INDIRECT_X.value):
+                with m.If(self.at(5)):
+                    m.d.comb += self.src8_1.eq(output)
+                    m.d.comb += self.src8_2.eq(self.value)
+                    m.d.comb += self.alu8_func.eq(func)
 
-                m.d.ph1 += self.adl.eq(self.Din)
-                m.d.ph1 += self.adh.eq(0)
-                m.d.ph1 += self.RW.eq(1)
+                    with m.If(store):
+                        m.d.ph1 += output.eq(self.alu8)
 
-            with m.If(self.cycle == 2):
-                m.d.ph1 += self.tmp16l.eq(self.Din)
-                m.d.ph1 += self.adl.eq(self.tmp8 + 1)
-                m.d.ph1 += self.adh.eq(0)
-                m.d.ph1 += self.RW.eq(1)
+                    self.end_instr(m)
 
-            with m.If(self.cycle == 3):
-                m.d.ph1 += self.tmp16h.eq(self.Din)
+            with m.Case(AddressModes.ZEROPAGE.value):
+                self.read_byte(m, cycle=1, addr=self.operand, comb_dest=self.src8_2)
 
-                m.d.ph1 += self.adl.eq(addr_ind)
-                m.d.ph1 += self.adh.eq(self.Din)
-                m.d.ph1 += self.RW.eq(1)
+                with m.If(self.at(2)):
+                    m.d.comb += self.src8_1.eq(output)
+                    m.d.comb += self.alu8_func.eq(func)
 
-            with m.If(self.cycle == 4):
-                m.d.ph1 += self.adl.eq(addr_ind)
-                m.d.ph1 += self.adh.eq(self.tmp16h + addr_ind[8])
-                m.d.ph1 += self.Dout.eq(self.a)
-                m.d.ph1 += self.RW.eq(0)
+                    with m.If(store):
+                        m.d.ph1 += output.eq(self.alu8)
 
-            with m.If(self.cycle == 5):
-                self.end_instr(m, self.pc)
+                    self.end_instr(m)
 
-    def JMP(self, m: Module):
-        # 0b01001100: 0x4C jmp $hhll
-        # 0b01101100: 0x6C jmp ($hhll)
+            with m.Case(AddressModes.IMMEDIATE.value):
+                with m.If(self.at(1)):
+                    m.d.comb += self.src8_1.eq(output)
+                    m.d.comb += self.src8_2.eq(self.operand)
+                    m.d.comb += self.alu8_func.eq(func)
 
-        with m.If(self.mode_a == 2):
-            operand = self.mode_absolute(m)
+                    with m.If(store):
+                        m.d.ph1 += output.eq(self.alu8)
 
-            with m.If(self.cycle == 2):
-                self.end_instr(m, operand)
+                    self.end_instr(m, self.pc_p1)
 
-        with m.Elif(self.mode_a == 3):
-            operand = self.mode_indirect(m)
+            with m.Case(AddressModes.ABSOLUTE.value):
+                self.read_byte(m, cycle=2, addr=self.operand, comb_dest=self.src8_2)
 
-            with m.If(self.cycle == 4):
-                self.end_instr(m, operand)
+                with m.If(self.at(3)):
+                    m.d.comb += self.src8_1.eq(output)
+                    m.d.comb += self.alu8_func.eq(func)
 
-    def TR(self, m: Module, func: ALU8Func, input: Statement, output: Statement):
-        with m.If(self.cycle == 1):
-            m.d.comb += self.src8_1.eq(output)
-            m.d.comb += self.src8_2.eq(input)
-            m.d.comb += self.alu8_func.eq(func)
+                    with m.If(store):
+                        m.d.ph1 += output.eq(self.alu8)
 
-            m.d.ph1 += output.eq(self.alu8)
+                    self.end_instr(m)
 
-            self.end_instr(m, self.pc)
+            with m.Case(AddressModes.INDIRECT_Y.value, AddressModes.ABSOLUTE_X.value,
+                        AddressModes.ABSOLUTE_Y.value):
+                # (indirect),Y always indexes with Y
+                m.d.comb += self.index.eq(
+                    Mux(self.mode_b == AddressModes.ABSOLUTE_X.value, x_index, self.y))
 
-    def ALU_IMP(self, m, func: ALU8Func, output: Statement, store: bool = True):
-        operand = self.mode_immediate(m)
+                with m.If(self.indexed_done):
+                    m.d.comb += self.src8_1.eq(output)
+                    m.d.comb += self.src8_2.eq(self.operand)
+                    m.d.comb += self.alu8_func.eq(func)
 
-        with m.If(self.cycle == 1):
-            m.d.comb += self.src8_1.eq(output)
-            m.d.comb += self.src8_2.eq(operand)
-            m.d.comb += self.alu8_func.eq(func)
+                    with m.If(store):
+                        m.d.ph1 += output.eq(self.alu8)
 
-            if store:
-                m.d.ph1 += output.eq(self.alu8)
+            with m.Case(AddressModes.ZEROPAGE_IND.value):
+                with m.If(self.at(1)):
+                    m.d.ph1 += self.pc.eq(self.pc_p1)
 
-            self.end_instr(m, self.pc + 1)
+                    m.d.ph1 += self.tmp8.eq(self.Din) # zp
+                    self.read_zeropage(m, self.Din)
 
-    def ALU(self, m: Module, func: ALU8Func, x_index: Statement, output: Statement, store: bool = True):
-        with m.If(self.mode_b == AddressModes.INDIRECT_X.value):
-            operand, value = self.mode_indirect_x(m)
+                with m.If(self.at(2)):
+                    self.read_zeropage(m, self.tmp8 + x_index) # zp + X
 
-            with m.If(self.cycle == 5):
-                m.d.comb += self.src8_1.eq(output)
-                m.d.comb += self.src8_2.eq(value)
-                m.d.comb += self.alu8_func.eq(func)
+                with m.If(self.at(3)):
+                    m.d.comb += self.src8_1.eq(output)
+                    m.d.comb += self.src8_2.eq(self.Din)
+                    m.d.comb += self.alu8_func.eq(func)
 
-                if store:
-                    m.d.ph1 += output.eq(self.alu8)
+                    with m.If(store):
+                        m.d.ph1 += output.eq(self.alu8)
 
-                self.end_instr(m, self.pc)
+                    self.end_instr(m)
 
-        with m.Elif(self.mode_b == AddressModes.ZEROPAGE.value):
-            operand = self.mode_zeropage(m)
+            with m.Default():
+                pass
 
-            self.read_byte(m, cycle=1, addr=operand, comb_dest=self.src8_2)
+    def BR(self, m: Module):
+        """Branch instructions."""
 
-            with m.If(self.cycle == 2):
-                m.d.comb += self.src8_1.eq(output)
-                m.d.comb += self.alu8_func.eq(func)
+        operand = self.operand[:8]
 
-                if store:
-                    m.d.ph1 += output.eq(self.alu8)
+        m.d.comb += self.index_base.eq(self.pcl)
+        m.d.comb += self.index.eq(operand)
 
-                self.end_instr(m, self.pc)
+        backwards = operand[7]
+        co = self.overflow
 
-        with m.Elif(self.mode_b == AddressModes.IMMEDIATE.value):
-            operand = self.mode_immediate(m)
+        crossed = Signal()
+        m.d.comb += crossed.eq(co ^ backwards)
 
-            with m.If(self.cycle == 1):
-                m.d.comb += self.src8_1.eq(output)
-                m.d.comb += self.src8_2.eq(operand)
-                m.d.comb += self.alu8_func.eq(func)
+        with m.If(self.at(1)):
+            take_branch = self.branch_cond(m)
 
-                if store:
-                    m.d.ph1 += output.eq(self.alu8)
+            with m.If(~take_branch):
+                self.end_instr(m, self.pc_p1)
 
-                self.end_instr(m, self.pc + 1)
+        with m.If(self.at(2)):
+            with m.If(crossed):
+                # sign-extend the offset into the high byte
+                m.d.ph1 += self.tmp16l.eq(self.addr_ind)
+                m.d.ph1 += self.tmp16h.eq(self.pch + Repl(backwards, 8) + co)
+            with m.Else():
+                self.end_instr(m, Cat(self.addr_ind, self.pch))
 
-        with m.Elif(self.mode_b == AddressModes.ABSOLUTE.value):
-            operand = self.mode_absolute(m)
+        with m.If(self.at(3)):
+            self.end_instr(m, self.tmp16)
 
-            self.read_byte(m, cycle=2, addr=operand, comb_dest=self.src8_2)
+    def branch_cond(self, m: Module) -> Signal:
+        """Returns the branch condition selected by mode_a.
 
-            with m.If(self.cycle == 3):
-                m.d.comb += self.src8_1.eq(output)
-                m.d.comb += self.alu8_func.eq(func)
+        mode_a[1:3] picks the flag (N, V, C, Z) and mode_a[0] is the
+        value the flag must have for the branch to be taken.
+        """
+        cond = Signal()
+        flags = Array([self.sr_flags[FLAG_N], self.sr_flags[FLAG_V],
+                       self.sr_flags[FLAG_C], self.sr_flags[FLAG_Z]])
 
-                if store:
-                    m.d.ph1 += output.eq(self.alu8)
+        m.d.comb += cond.eq(flags[self.mode_a[1:3]] ^ ~self.mode_a[0])
 
-                self.end_instr(m, self.pc)
+        return cond
 
-        with m.Elif(self.mode_b == AddressModes.INDIRECT_Y.value):
-            operand = self.mode_indirect_y(m)
+    def FLAG(self, m: Module, func: Value):
+        """Clears or sets a flag (CLC, SEC, CLD, SED, CLI, SEI, CLV)."""
+        with m.If(self.at(1)):
+            m.d.comb += self.alu8_func.eq(func)
+            self.end_instr(m)
 
-            with m.If(self.cycle == 4):
-                m.d.comb += self.src8_1.eq(output)
-                m.d.comb += self.src8_2.eq(operand)
-                m.d.comb += self.alu8_func.eq(func)
+    def ALU2(self, m: Module, func: Value):
+        # implied accumulator mode
+        with m.Switch(self.mode_b):
+            with m.Case(AddressModes.IMMEDIATE.value):
+                with m.If(self.at(1)):
+                    m.d.comb += self.src8_1.eq(self.a)
+                    m.d.comb += self.alu8_func.eq(func)
+                    m.d.ph1 += self.a.eq(self.alu8)
 
-                if store:
-                    m.d.ph1 += output.eq(self.alu8)
+                    self.end_instr(m)
 
-            with m.If(self.cycle == 5):
-                m.d.comb += self.src8_1.eq(output)
-                m.d.comb += self.src8_2.eq(operand)
-                m.d.comb += self.alu8_func.eq(func)
+            with m.Case(AddressModes.ZEROPAGE.value):
+                self.read_byte(m, cycle=1, addr=self.operand, comb_dest=self.src8_1)
 
-                if store:
-                    m.d.ph1 += output.eq(self.alu8)
+                with m.If(self.at(2)):
+                    m.d.ph1 += self.tmp8.eq(self.src8_1)
+                    m.d.ph1 += self.RW.eq(0)
+                    m.d.ph1 += self.Addr.eq(self.operand)
+                    m.d.ph1 += self.Dout.eq(self.src8_1)
 
-        with m.Elif(self.mode_b == AddressModes.ZEROPAGE_IND.value):
-            with m.If(self.cycle == 1):
-                m.d.ph1 += self.pc.eq(self.pc + 1)
+                with m.If(self.at(3)):
+                    m.d.comb += self.src8_1.eq(self.tmp8)
+                    m.d.comb += self.alu8_func.eq(func)
 
-                m.d.ph1 += self.tmp8.eq(self.Din) # zp
-                m.d.ph1 += self.adl.eq(self.Din)
-                m.d.ph1 += self.adh.eq(0)
-                m.d.ph1 += self.RW.eq(1)
+                    m.d.ph1 += self.RW.eq(0)
+                    m.d.ph1 += self.Addr.eq(self.operand)
+                    m.d.ph1 += self.Dout.eq(self.alu8)
 
-            with m.If(self.cycle == 2):
-                m.d.ph1 += self.adl.eq(self.tmp8 + x_index) # zp + X
-                m.d.ph1 += self.adh.eq(0)
-                m.d.ph1 += self.RW.eq(1)
+                with m.If(self.at(4)):
+                    self.end_instr(m)
 
-            with m.If(self.cycle == 3):
-                m.d.comb += self.src8_1.eq(output)
-                m.d.comb += self.src8_2.eq(self.Din)
-                m.d.comb += self.alu8_func.eq(func)
+            with m.Case(AddressModes.ZEROPAGE_IND.value):
+                with m.If(self.at(1)):
+                    m.d.ph1 += self.pc.eq(self.pc_p1)
 
-                if store:
-                    m.d.ph1 += output.eq(self.alu8)
+                    # latch the indexed address, wrapping in page zero
+                    m.d.ph1 += self.tmp16l.eq(self.Din + self.x)
+                    m.d.ph1 += self.tmp16h.eq(0)
+                    self.read_zeropage(m, self.Din)
 
-                self.end_instr(m, self.pc)
+                with m.If(self.at(2)):
+                    self.read_zeropage(m, self.tmp16l)
 
-        with m.Elif(self.mode_b == AddressModes.ABSOLUTE_Y.value):
-            self.mode_absolute_indexed(m, func=func, index=self.y, output=output, store=store)
+                with m.If(self.at(3)):
+                    m.d.ph1 += self.tmp8.eq(self.Din)
+                    m.d.ph1 += self.RW.eq(0)
+                    m.d.ph1 += self.Addr.eq(self.tmp16)
 
-        with m.Elif(self.mode_b == AddressModes.ABSOLUTE_X.value):
-            self.mode_absolute_indexed(m, func=func, index=x_index, output=output, store=store)
+                with m.If(self.at(4)):
+                    m.d.comb += self.src8_1.eq(self.tmp8)
+                    m.d.comb += self.alu8_func.eq(func)
 
-    def BR(self, m: Module):
-        """Branch instructions."""
+                    m.d.ph1 += self.RW.eq(0)
+                    m.d.ph1 += self.Addr.eq(self.tmp16)
+                    m.d.ph1 += self.Dout.eq(self.alu8)
 
-        operand = self.mode_immediate(m)
+                with m.If(self.at(5)):
+                    self.end_instr(m)
 
-        sum9 = Signal(9)
-        m.d.comb += sum9.eq(self.pcl + operand)
+            with m.Case(AddressModes.ABSOLUTE.value):
+                with m.If(self.at(2)):
+                    m.d.ph1 += self.Addr.eq(self.operand)
 
-        backwards = operand[7]
-        co = sum9[8]
+                with m.If(self.at(3)):
+                    m.d.ph1 += self.tmp8.eq(self.Din)
 
-        crossed = Signal()
-        m.d.comb += crossed.eq(co ^ backwards)
+                    m.d.ph1 += self.Addr.eq(self.operand)
+                    m.d.ph1 += self.Dout.eq(self.Din)
 
-        with m.If(self.cycle == 1):
-            take_branch = self.branch_cond(m)
+                with m.If(self.at(4)):
+                    m.d.comb += self.src8_1.eq(self.tmp8)
+                    m.d.comb += self.alu8_func.eq(func)
 
-            with m.If(~take_branch):
-                self.end_instr(m, self.pc + 1)
+                    m.d.ph1 += self.RW.eq(0)
+                    m.d.ph1 += self.Addr.eq(self.operand)
+                    m.d.ph1 += self.Dout.eq(self.alu8)
 
-        with m.If(self.cycle == 2):
-            with m.If(crossed):
-                m.d.ph1 += self.tmp16l.eq(sum9[:8])
-                m.d.ph1 += self.tmp16h.eq(Mux(backwards,
-                                              self.pch - crossed,
-                                              self.pch + crossed))
-            with m.Else():
-                self.end_instr(m, Cat(sum9[:8], self.pch))
+                with m.If(self.at(5)):
+                    self.end_instr(m)
 
-        with m.If(self.cycle == 3):
-            self.end_instr(m, self.tmp16)
+            with m.Case(AddressModes.ABSOLUTE_X.value):
+                m.d.comb += self.index.eq(self.x)
 
-    def branch_cond(self, m: Module) -> Signal:
-        cond = Signal()
+                with m.If(self.at(1)):
+                    m.d.ph1 += self.tmp16l.eq(self.Din)
+                    m.d.ph1 += self.pc.eq(self.pc_p1)
+                    m.d.ph1 += self.Addr.eq(self.pc_p1)
 
-        with m.Switch(self.mode_a):
-            with m.Case(0): # BPL
-                m.d.comb += cond.eq(~self.sr_flags[Flags.N])
-            with m.Case(1): # BMI
-                m.d.comb += cond.eq(self.sr_flags[Flags.N])
-            with m.Case(2): # BVC
-                m.d.comb += cond.eq(~self.sr_flags[Flags.V])
-            with m.Case(3): # BVS
-                m.d.comb += cond.eq(self.sr_flags[Flags.V])
-            with m.Case(4): # BCC
-                m.d.comb += cond.eq(~self.sr_flags[Flags.C])
-            with m.Case(5): # BCS
-                m.d.comb += cond.eq(self.sr_flags[Flags.C])
-            with m.Case(6): # BNE
-                m.d.comb += cond.eq(~self.sr_flags[Flags.Z])
-            with m.Case(7): # BEQ
-                m.d.comb += cond.eq(self.sr_flags[Flags.Z])
+                with m.If(self.at(2)):
+                    m.d.ph1 += self.pc.eq(self.pc_p1)
+                    m.d.ph1 += self.tmp16l.eq(self.addr_ind)
+                    m.d.ph1 += self.tmp16h.eq(self.Din + self.overflow)
+                    m.d.ph1 += self.Addr.eq(Cat(self.addr_ind, self.tmp16h))
 
-        return cond
+                with m.If(self.at(3)):
+                    # re-read from corrected address
+                    m.d.ph1 += self.Addr.eq(self.tmp16)
 
-    def CL_SE_C(self, m: Module):
-        """Clears or sets carry flag."""
-        with m.If(self.cycle == 1):
-            m.d.comb += self.alu8_func.eq(
-                Mux(self.instr[5], ALU8Func.SEC, ALU8Func.CLC))
-            self.end_instr(m, self.pc)
-
-    def CL_SE_D(self, m: Module):
-        """Clears or sets decimal flag."""
-        with m.If(self.cycle == 1):
-            m.d.comb += self.alu8_func.eq(
-                Mux(self.instr[5], ALU8Func.SED, ALU8Func.CLD))
-            self.end_instr(m, self.pc)
-
-    def CL_SE_I(self, m: Module):
-        """Clears or sets interrupt flag."""
-        with m.If(self.cycle == 1):
-            m.d.comb += self.alu8_func.eq(
-                Mux(self.instr[5], ALU8Func.SEI, ALU8Func.CLI))
-            self.end_instr(m, self.pc)
-
-    def CLV(self, m: Module):
-        """Clears overflow flag."""
-        with m.If(self.cycle == 1):
-            m.d.comb += self.alu8_func.eq(ALU8Func.CLV)
-            self.end_instr(m, self.pc)
-
-    def ALU2(self, m: Module, func: ALU8Func):
-        # implied accumulator mode
-        with m.If(self.mode_b == AddressModes.IMMEDIATE.value):
-            with m.If(self.cycle == 1):
-                m.d.comb += self.src8_1.eq(self.a)
-                m.d.comb += self.src8_2.eq(0)
-                m.d.comb += self.alu8_func.eq(func)
-                m.d.ph1 += self.a.eq(self.alu8)
-
-                self.end_instr(m, self.pc)
-
-        with m.Elif(self.mode_b == AddressModes.ZEROPAGE.value):
-            operand = self.mode_zeropage(m)
-
-            self.read_byte(m, cycle=1, addr=operand, comb_dest=self.src8_1)
-
-            with m.If(self.cycle == 2):
-                m.d.ph1 += self.tmp8.eq(self.src8_1)
-                m.d.ph1 += self.RW.eq(0)
-                m.d.ph1 += self.Addr.eq(operand)
-                m.d.ph1 += self.Dout.eq(self.src8_1)
-
-            with m.If(self.cycle == 3):
-                m.d.comb += self.src8_1.eq(self.tmp8)
-                m.d.comb += self.src8_2.eq(0)
-                m.d.comb += self.alu8_func.eq(func)
-
-                m.d.ph1 += self.RW.eq(0)
-                m.d.ph1 += self.Addr.eq(operand)
-                m.d.ph1 += self.Dout.eq(self.alu8)
-
-            with m.If(self.cycle == 4):
-                self.end_instr(m, self.pc)
-
-        with m.Elif(self.mode_b == AddressModes.ZEROPAGE_IND.value):
-            zp_ind = (self.tmp16l + self.x)[:8]
-
-            with m.If(self.cycle == 1):
-                m.d.ph1 += self.tmp16l.eq(self.Din)
-                m.d.ph1 += self.tmp16h.eq(0)
-                m.d.ph1 += self.adl.eq(self.Din)
-                m.d.ph1 += self.adh.eq(0)
-                m.d.ph1 += self.RW.eq(1)
-
-            with m.If(self.cycle == 2):
-                m.d.ph1 += self.tmp16l.eq(zp_ind)
-                m.d.ph1 += self.adl.eq(zp_ind)
-                m.d.ph1 += self.adh.eq(0)
-                m.d.ph1 += self.RW.eq(1)
-
-            with m.If(self.cycle == 3):
-                m.d.ph1 += self.tmp8.eq(self.Din)
-                m.d.ph1 += self.RW.eq(0)
-                m.d.ph1 += self.Addr.eq(self.tmp16)
-
-            with m.If(self.cycle == 4):
-                m.d.comb += self.src8_1.eq(self.tmp8)
-                m.d.comb += self.src8_2.eq(0)
-                m.d.comb += self.alu8_func.eq(func)
-
-                m.d.ph1 += self.RW.eq(0)
-                m.d.ph1 += self.Addr.eq(operand)
-                m.d.ph1 += self.Dout.eq(self.alu8)
-
-            with m.If(self.cycle == 5):
-                self.end_instr(m, self.pc)
-
-        with m.Elif(self.mode_b == AddressModes.ABSOLUTE.value):
-            operand = self.mode_absolute(m)
-
-            with m.If(self.cycle == 2):
-                m.d.ph1 += self.Addr.eq(operand)
-                m.d.ph1 += self.RW.eq(1)
-
-            with m.If(self.cycle == 3):
-                m.d.ph1 += self.tmp8.eq(self.Din)
-
-                m.d.ph1 += self.RW.eq(1)
-                m.d.ph1 += self.Addr.eq(operand)
-                m.d.ph1 += self.Dout.eq(self.Din)
-
-            with m.If(self.cycle == 4):
-                m.d.comb += self.src8_1.eq(self.tmp8)
-                m.d.comb += self.src8_2.eq(0)
-                m.d.comb += self.alu8_func.eq(func)
-
-                m.d.ph1 += self.RW.eq(0)
-                m.d.ph1 += self.Addr.eq(operand)
-                m.d.ph1 += self.Dout.eq(self.alu8)
-
-            with m.If(self.cycle == 5):
-                self.end_instr(m, self.pc)
-
-        with m.Elif(self.mode_b == AddressModes.ABSOLUTE_X.value):
-            sum9 = Signal(9)
-            overflow = Signal()
-            m.d.comb += sum9.eq(self.tmp16l + self.x)
-            m.d.comb += overflow.eq(sum9[8])
-
-            with m.If(self.cycle == 1):
-                m.d.ph1 += self.tmp16l.eq(self.Din)
-                m.d.ph1 += self.pc.eq(self.pc + 1)
-                m.d.ph1 += self.Addr.eq(self.pc + 1)
-                m.d.ph1 += self.RW.eq(1)
-
-            with m.If(self.cycle == 2):
-                m.d.ph1 += self.pc.eq(self.pc + 1)
-                m.d.ph1 += self.tmp16l.eq(sum9[:8])
-                m.d.ph1 += self.tmp16h.eq(self.Din + overflow)
-                m.d.ph1 += self.Addr.eq(Cat(sum9[:8], self.tmp16h))
-                m.d.ph1 += self.RW.eq(1)
-
-            with m.If(self.cycle == 3):
-                # re-read from corrected address
-                m.d.ph1 += self.Addr.eq(self.tmp16)
-                m.d.ph1 += self.RW.eq(1)
-
-            with m.If(self.cycle == 4):
-                m.d.ph1 += self.tmp8.eq(self.Din)
-
-                m.d.ph1 += self.RW.eq(0)
-                m.d.ph1 += self.Addr.eq(operand)
-                m.d.ph1 += self.Dout.eq(self.Din)
-
-            with m.If(self.cycle == 5):
-                m.d.comb += self.src8_1.eq(self.tmp8)
-                m.d.comb += self.src8_2.eq(0)
-                m.d.comb += self.alu8_func.eq(func)
-
-                m.d.ph1 += self.RW.eq(0)
-                m.d.ph1 += self.Addr.eq(operand)
-                m.d.ph1 += self.Dout.eq(self.alu8)
-
-            with m.If(self.cycle == 6):
-                self.end_instr(m, self.pc)
+                with m.If(self.at(4)):
+                    m.d.ph1 += self.tmp8.eq(self.Din)
+
+                    m.d.ph1 += self.RW.eq(0)
+                    m.d.ph1 += self.Addr.eq(self.tmp16)
+                    m.d.ph1 += self.Dout.eq(self.Din)
+
+                with m.If(self.at(5)):
+                    m.d.comb += self.src8_1.eq(self.tmp8)
+                    m.d.comb += self.alu8_func.eq(func)
+
+                    m.d.ph1 += self.RW.eq(0)
+                    m.d.ph1 += self.Addr.eq(self.tmp16)
+                    m.d.ph1 += self.Dout.eq(self.alu8)
+
+                with m.If(self.at(6)):
+                    self.end_instr(m)
+
+            with m.Default():
+                pass
 
     def mode_indirect_x(self, m: Module) -> List[Statement]:
         """Generates logic to get 8-bit operand for indexed indirect addressing instructions.
+
+        Returns the 16-bit effective address, valid from cycle 4, and the
+        8-bit value read from it, valid from cycle 5.
         """
-        value = Mux(self.cycle == 4, self.Din, self.tmp8)
+        value = self.tmp8
         operand = self.tmp16
 
         addr_ind = self.Din + self.x
 
-        with m.If(self.cycle == 1):
+        with m.If(self.at(1)):
             # fetch pointer
             m.d.ph1 += self.tmp8.eq(addr_ind)
-            m.d.ph1 += self.pc.eq(self.pc + 1)
-            m.d.ph1 += self.adh.eq(0)
-            m.d.ph1 += self.adl.eq(addr_ind)
-            m.d.ph1 += self.RW.eq(1)
+            m.d.ph1 += self.pc.eq(self.pc_p1)
+            self.read_zeropage(m, addr_ind)
 
-        with m.If(self.cycle == 2):
+        with m.If(self.at(2)):
             # read low byte
             m.d.ph1 += self.tmp16l.eq(self.Din)
-            m.d.ph1 += self.adh.eq(0)
-            m.d.ph1 += self.adl.eq(self.tmp8 + 1)
-            m.d.ph1 += self.RW.eq(1)
+            self.read_zeropage(m, self.tmp8_p1)
 
-        with m.If(self.cycle == 3):
+        with m.If(self.at(3)):
             # read high byte
             m.d.ph1 += self.tmp16h.eq(self.Din)
             m.d.ph1 += self.adh.eq(self.Din)
             m.d.ph1 += self.adl.eq(self.tmp16l)
-            m.d.ph1 += self.RW.eq(1)
 
-        with m.If(self.cycle == 4):
+        with m.If(self.at(4)):
             # read value
             m.d.ph1 += self.tmp8.eq(self.Din)
 
@@ -1168,13 +1185,12 @@ class Core(Elaboratable):
         Returns a Statement containing an 8-bit operand.
         After cycle 1, tmp8 contains the operand.
         """
-        operand = Mux(self.cycle == 1, self.Din, self.tmp8)
+        operand = Mux(self.at(1), self.Din, self.tmp8)
 
-        with m.If(self.cycle == 1):
+        with m.If(self.at(1)):
             m.d.ph1 += self.tmp8.eq(self.Din)
-            m.d.ph1 += self.pc.eq(self.pc + 1)
-            m.d.ph1 += self.Addr.eq(self.pc + 1)
-            m.d.ph1 += self.RW.eq(1)
+            m.d.ph1 += self.pc.eq(self.pc_p1)
+            m.d.ph1 += self.Addr.eq(self.pc_p1)
 
         return operand
 
@@ -1184,31 +1200,29 @@ class Core(Elaboratable):
         Returns a Statement containing a 16-bit address where the upper byte is zero.
         After cycle 1, tmp16 contains the address.
         """
-        operand = Mux(self.cycle == 1, self.Din, self.tmp16)
+        operand = Mux(self.at(1), self.Din, self.tmp16)
 
-        with m.If(self.cycle == 1):
+        with m.If(self.at(1)):
             m.d.ph1 += self.tmp16h.eq(0)
             m.d.ph1 += self.tmp16l.eq(self.Din)
-            m.d.ph1 += self.pc.eq(self.pc + 1)
-            m.d.ph1 += self.Addr.eq(self.pc + 1)
-            m.d.ph1 += self.RW.eq(1)
+            m.d.ph1 += self.pc.eq(self.pc_p1)
+            m.d.ph1 += self.Addr.eq(self.pc_p1)
 
         return operand
 
     def mode_zeropage_indexed(self, m: Module, index: Signal) -> Statement:
         """Generates logic to get the 8-bit zero-page address for zeropage X mode instructions.
 
-        Returns a Statement containing a 16-bit address where the upper byte is zero.
-        After cycle 1, tmp16 contains the address.
+        Returns a Statement containing a 16-bit address where the upper byte is zero,
+        valid from cycle 2. After cycle 1, tmp16 contains the address.
         """
-        operand = Mux(self.cycle == 1, self.Din, self.tmp16)
+        operand = self.tmp16
 
-        with m.If(self.cycle == 1):
+        with m.If(self.at(1)):
             m.d.ph1 += self.tmp16l.eq(self.Din + index)
             m.d.ph1 += self.tmp16h.eq(0)
-            m.d.ph1 += self.pc.eq(self.pc + 1)
-            m.d.ph1 += self.Addr.eq(self.pc + 1)
-            m.d.ph1 += self.RW.eq(1)
+            m.d.ph1 += self.pc.eq(self.pc_p1)
+            m.d.ph1 += self.Addr.eq(self.pc_p1)
 
         return operand
 
@@ -1218,150 +1232,140 @@ class Core(Elaboratable):
         Returns a Statement containing the 16-bit operand. After cycle 2, tmp16
         contains the operand.
         """
-        operand = Mux(self.cycle == 2, Cat(self.tmp16l, self.Din), self.tmp16)
+        operand = Mux(self.at(2), Cat(self.tmp16l, self.Din), self.tmp16)
 
-        with m.If(self.cycle == 1):
+        with m.If(self.at(1)):
             m.d.ph1 += self.tmp16l.eq(self.Din)
-            m.d.ph1 += self.pc.eq(self.pc + 1)
-            m.d.ph1 += self.Addr.eq(self.pc + 1)
-            m.d.ph1 += self.RW.eq(1)
+            m.d.ph1 += self.pc.eq(self.pc_p1)
+            m.d.ph1 += self.Addr.eq(self.pc_p1)
 
-        with m.If(self.cycle == 2):
+        with m.If(self.at(2)):
             m.d.ph1 += self.tmp16h.eq(self.Din)
-            m.d.ph1 += self.pc.eq(self.pc + 1)
+            m.d.ph1 += self.pc.eq(self.pc_p1)
 
         return operand
 
-    def mode_indirect_y(self, m: Module, write: bool = False) -> Statement:
-        sum9  = Signal(9)
-        overflow = Signal()
+    def mode_indirect_y(self, m: Module) -> Statement:
+        """Generates logic to get the 8-bit operand for indirect indexed instructions.
 
-        m.d.comb += sum9.eq(self.tmp16l + self.y)
-        m.d.comb += overflow.eq(sum9[8])
+        Returns Din, which holds the operand in the cycle indexed_done is set:
+        cycle 4, or cycle 5 when the page boundary is crossed.
+        """
+        m.d.comb += self.index.eq(self.y)
 
         operand = self.Din
 
         # fetch pointer address
-        with m.If(self.cycle == 1):
+        with m.If(self.at(1)):
             m.d.ph1 += self.tmp8.eq(self.Din)
-            m.d.ph1 += self.pc.eq(self.pc + 1)
-            m.d.ph1 += self.adl.eq(self.Din)
-            m.d.ph1 += self.adh.eq(0)
-            m.d.ph1 += self.RW.eq(1)
+            m.d.ph1 += self.pc.eq(self.pc_p1)
+            self.read_zeropage(m, self.Din)
 
         # fetch address low
-        with m.If(self.cycle == 2):
+        with m.If(self.at(2)):
             m.d.ph1 += self.tmp16l.eq(self.Din)
-            m.d.ph1 += self.adl.eq(self.tmp8 + 1)
-            m.d.ph1 += self.adh.eq(0)
-            m.d.ph1 += self.RW.eq(1)
+            self.read_zeropage(m, self.tmp8_p1)
 
         # fetch address high
-        with m.If(self.cycle == 3):
+        with m.If(self.at(3)):
             m.d.ph1 += self.tmp16h.eq(self.Din)
 
             # read from effective address (maybe incorrect)
-            m.d.ph1 += self.adl.eq(sum9[:8])
-            m.d.ph1 += self.adh.eq(self.Din)
-            m.d.ph1 += self.RW.eq(1)
+            m.d.ph1 += self.Addr.eq(Cat(self.addr_ind, self.Din))
 
-        with m.If(self.cycle == 4):
+        with m.If(self.at(4)):
             # prepare to read from corrected effective address
-            with m.If(overflow):
-                m.d.ph1 += self.adl.eq(self.tmp16l)
-                m.d.ph1 += self.adh.eq(self.tmp16h + overflow)
-                m.d.ph1 += self.RW.eq(1)
+            with m.If(self.overflow):
+                m.d.ph1 += self.adh.eq(self.adh_next)
 
             with m.Else():
-                self.end_instr(m, self.pc)
+                self.end_instr(m)
+
+        with m.If(self.at(5)):
+            self.end_instr(m)
+
+        # the operand is on Din in the last cycle only
+        m.d.comb += self.indexed_done.eq((self.at(4) & ~self.overflow) | self.at(5))
 
         return operand
 
-    def mode_absolute_indexed(self, m: Module, func: ALU8Func, index: Signal, output: Statement, store: bool = True):
-        m.d.comb += self.sum9.eq(self.tmp16l + index)
+    def mode_absolute_indexed(self, m: Module) -> Statement:
+        """Generates logic to get the 8-bit operand for absolute indexed instructions.
+
+        The handler selects the index register through self.index. Returns
+        Din, which holds the operand in the cycle indexed_done is set:
+        cycle 3, or cycle 4 when the page boundary is crossed.
+        """
+        operand = self.Din
 
         # fetch low operand
-        with m.If(self.cycle == 1):
+        with m.If(self.at(1)):
             m.d.ph1 += self.tmp16l.eq(self.Din)
-            m.d.ph1 += self.pc.eq(self.pc + 1)
-            m.d.ph1 += self.Addr.eq(self.pc + 1)
-            m.d.ph1 += self.RW.eq(1)
+            m.d.ph1 += self.pc.eq(self.pc_p1)
+            m.d.ph1 += self.Addr.eq(self.pc_p1)
 
         # fetch high operand
-        with m.If(self.cycle == 2):
+        with m.If(self.at(2)):
             m.d.ph1 += self.tmp16h.eq(self.Din)
-            m.d.ph1 += self.pc.eq(self.pc + 1)
+            m.d.ph1 += self.pc.eq(self.pc_p1)
             # read from address + I
             m.d.ph1 += self.Addr.eq(Cat(self.addr_ind, self.Din))
-            m.d.ph1 += self.RW.eq(1)
-
-        with m.If(self.cycle == 3):
-            with m.If(self.overflow):
-                # fix the high byte if overflowed
-                m.d.ph1 += self.tmp16h.eq(self.tmp16h + 1)
-                m.d.ph1 += self.adl.eq(self.addr_ind)
-                m.d.ph1 += self.adh.eq(self.tmp16h + 1)
-                m.d.ph1 += self.RW.eq(1)
-
-            with m.Else():
-                # assign readed value
-                m.d.comb += self.src8_1.eq(output)
-                m.d.comb += self.src8_2.eq(self.Din)
-                m.d.comb += self.alu8_func.eq(func)
-
-                if store:
-                    m.d.ph1 += output.eq(self.alu8)
 
-                self.end_instr(m, self.pc)
+        with m.If(self.at(3) & self.overflow):
+            # fix the high byte if overflowed
+            m.d.ph1 += self.Addr.eq(Cat(self.addr_ind, self.adh_next))
 
-        with m.If(self.cycle == 4):
-            # execute only if page boundary crossed
-            m.d.comb += self.src8_1.eq(output)
-            m.d.comb += self.src8_2.eq(self.Din)
-            m.d.comb += self.alu8_func.eq(func)
+        # the value is read in cycle 3, or in cycle 4 if the page boundary is crossed
+        m.d.comb += self.indexed_done.eq((self.at(3) & ~self.overflow) | self.at(4))
 
-            if store:
-                m.d.ph1 += output.eq(self.alu8)
+        with m.If(self.indexed_done):
+            self.end_instr(m)
 
-            self.end_instr(m, self.pc)
+        return operand
 
-    def mode_indirect(self, m: Module) -> Statement:
+    def mode_indirect(self, m: Module, pointer: Statement) -> Statement:
         """Generates logic to get the 16-bit address for indirect mode instructions.
 
-        Returns a Statement containing the 16-bit address. After cycle 4, tmp16
-        contains the address.
+        pointer is the operand fetched by mode_absolute. Returns a Statement
+        containing the 16-bit address, valid in cycle 4.
         """
 
-        pointer = self.mode_absolute(m)
-
-        with m.If(self.cycle == 2):
+        with m.If(self.at(2)):
             m.d.ph1 += self.Addr.eq(pointer)
-            m.d.ph1 += self.RW.eq(1)
 
-        with m.If(self.cycle == 3):
+        with m.If(self.at(3)):
             m.d.ph1 += self.pcl.eq(self.Din)
 
-            m.d.ph1 += self.adl.eq(pointer[:8] + 1)
-            m.d.ph1 += self.adh.eq(pointer[8:])
-            m.d.ph1 += self.RW.eq(1)
+            # the pointer is in tmp16 by now
+            m.d.ph1 += self.adl.eq(self.tmp16l + 1)
+            m.d.ph1 += self.adh.eq(self.tmp16h)
 
-        with m.If(self.cycle == 4):
+        with m.If(self.at(4)):
             m.d.ph1 += self.pch.eq(self.Din)
 
-        operand = Mux(self.cycle == 4, Cat(self.pcl, self.Din), self.pc)
+        operand = Cat(self.pcl, self.Din)
 
         return operand
 
+
+def load_formal(insn: str) -> Verification:
+    """Returns the verification from formal/formal_<insn>.py."""
+    module = importlib.import_module(f"formal.formal_{insn}")
+    return module.Formal()
+
+
 if __name__ == "__main__":
     parser = main_parser()
     parser.add_argument("--insn")
+    parser.add_argument("--cycles", type=int, default=20,
+                        help="number of cycles to simulate")
+    parser.add_argument("--vcd", action="store_true",
+                        help="write the simulation trace to test.vcd")
     args = parser.parse_args()
 
     verification: Optional[Verification] = None
     if args.insn is not None:
-        module = importlib.import_module(f"formal.formal_{args.insn}")
-        formal_class = getattr(module, "Formal")
-        verification = formal_class()
+        verification = load_formal(args.insn)
 
     m = Module()
     m.submodules.core = core = Core(verification)
@@ -1395,6 +1399,11 @@ if __name__ == "__main__":
 
         main_runner(parser, args, m, ports=core.ports() + [ph1clk, rst])
 
+    elif args.action == "generate":
+        # The bare core, e.g. "generate -t cc" for a compiled CXXRTL
+        # simulation driven by a native testbench.
+        main_runner(parser, args, m, ports=core.ports() + [ph1clk, rst])
+
     else:
         # Fake memory
         mem = {
@@ -1405,20 +1414,24 @@ if __name__ == "__main__":
             0x1236: 0x10,
             0xA010: 0xEA,  # NOP
         }
-        with m.Switch(core.Addr):
-            for addr, data in mem.items():
-                with m.Case(addr):
-                    m.d.comb += core.Din.eq(data)
-            with m.Default():
-                m.d.comb += core.Din.eq(0xFF)
+        # flat 64K image, read by the testbench for the address on the bus
+        image = bytearray([0xFF]) * 0x10000
+        for addr, data in mem.items():
+            image[addr] = data
 
         sim = Simulator(m)
         sim.add_clock(1e-6, domain="ph1")
 
         def process():
-            for _ in range(20):
-                yield
+            for _ in range(args.cycles):
+                yield Settle()
+                addr = yield core.Addr
+                yield core.Din.eq(image[addr])
+                yield Tick("ph1")
 
         sim.add_sync_process(process, domain="ph1")
-        with sim.write_vcd("test.vcd", "test.gtkw", traces=core.ports()):
+        if args.vcd:
+            with sim.write_vcd("test.vcd", "test.gtkw", traces=core.ports()):
+                sim.run()
+        else:
             sim.run()
@@ -204,6 +204,7 @@ class Alu2Verification(Verification):
             m.d.comb += actual_output.eq(data)
             m.d.comb += input.eq(value)
             m.d.comb += size.eq(2)
+            self.assert_registers(m, PC=self.data.pre_pc+size)
 
         with m.Elif(mode == AddressModes.ZEROPAGE_IND.value):
             self.assert_cycles(m, 6)
@@ -221,6 +222,7 @@ class Alu2Verification(Verification):
             m.d.comb += actual_output.eq(data)
             m.d.comb += input.eq(value)
             m.d.comb += size.eq(2)
+            self.assert_registers(m, PC=self.data.pre_pc+size)
 
         with m.Elif(mode == AddressModes.ABSOLUTE.value):
             self.assert_cycles(m, 6)
@@ -235,6 +237,7 @@ class Alu2Verification(Verification):
             m.d.comb += actual_output.eq(data)
             m.d.comb += input.eq(value)
             m.d.comb += size.eq(3)
+            self.assert_registers(m, PC=self.data.pre_pc+size)
 
         with m.Elif(mode == AddressModes.ABSOLUTE_X.value):
             self.assert_cycles(m, 7)
@@ -252,5 +255,6 @@ class Alu2Verification(Verification):
             m.d.comb += actual_output.eq(data)
             m.d.comb += input.eq(value)
             m.d.comb += size.eq(3)
+            self.assert_registers(m, PC=self.data.pre_pc+size)
 
         return (input, actual_output, size)
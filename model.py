@@ -0,0 +1,404 @@
+# model.py: Instruction level reference model of the 6502 core
+# Copyright (C) 2021 M.Magomedov <mmagomedoff@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# The model executes a whole instruction per step and returns the number
+# of cycles the core takes for it, so a simulation of the core only needs
+# to be compared against it at instruction boundaries. Interrupts are not
+# modelled.
+#
+# state is an indexable sequence of the registers (see the A..SR indices
+# below) and mem a 64K byte sequence. When numba is installed, the model
+# is compiled with njit and both should be numpy arrays. Bytes read from
+# mem are widened with int64 so every local has one signed integer type;
+# numba unifies uint64 and int64 to float64.
+
+from typing import List, Tuple
+
+from core import Handler, DECODED
+from alu8 import ALU8Func, ALU8_FLAG_FUNCS, BCD_CARRY, BCD_ADJUST
+from consts import AddressModes, FLAG_N, FLAG_V, FLAG_D, FLAG_I, FLAG_Z, FLAG_C
+
+try:
+    from numba import njit, int64
+except ImportError:
+    def njit(*args, **kwargs):
+        """Runs the model as plain Python when numba is not installed."""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+    int64 = int
+
+
+# state layout
+A, X, Y, SP, PC, SR = range(6)
+STATE_SIZE = 6
+
+_BCD_CARRY = tuple(BCD_CARRY)
+_BCD_ADJUST = tuple(BCD_ADJUST)
+
+# flag bit and value written by the flag functions, indexed by ALU8Func
+_FLAG_BIT = tuple(ALU8_FLAG_FUNCS.get(f, (0, 0))[0] for f in range(max(ALU8Func) + 1))
+_FLAG_VALUE = tuple(ALU8_FLAG_FUNCS.get(f, (0, 0))[1] for f in range(max(ALU8Func) + 1))
+
+
+def build_rom(decoded: List[Tuple] = DECODED) -> List[int]:
+    """Packs the decoded opcodes into one int per opcode:
+    handler | func << 8 | store << 16."""
+    return [int(handler) | (int(func) << 8) | (int(store) << 16)
+            for handler, func, store, _ in decoded]
+
+
+def reset(state, mem):
+    """Puts the registers in their state after a reset."""
+    state[A] = 0
+    state[X] = 0
+    state[Y] = 0
+    state[SP] = 0xFF
+    state[PC] = read16(mem, 0xFFFC)
+    state[SR] = 0b00100000
+
+
+@njit(cache=True)
+def set_nz(sr: int, value: int) -> int:
+    sr &= ~((1 << FLAG_N) | (1 << FLAG_Z)) & 0xFF
+    if value & 0x80:
+        sr |= 1 << FLAG_N
+    if value == 0:
+        sr |= 1 << FLAG_Z
+    return sr
+
+
+@njit(cache=True)
+def set_flag(sr: int, flag: int, value: int) -> int:
+    return (sr & ~(1 << flag) & 0xFF) | (value << flag)
+
+
+@njit(cache=True)
+def alu(func: int, input1: int, input2: int, sr: int) -> Tuple[int, int]:
+    """Returns (output, sr) for an ALU8 function, LDSR and the flag
+    functions excluded."""
+    carry_in = (sr >> FLAG_C) & 1
+
+    if func == ALU8Func.LD:
+        return input2, set_nz(sr, input2)
+
+    if func == ALU8Func.TR:
+        return input2, sr
+
+    if func == ALU8Func.ADC or func == ALU8Func.SBC or func == ALU8Func.SUB:
+        compare = func == ALU8Func.SUB
+        sub = func != ALU8Func.ADC
+        decimal = ((sr >> FLAG_D) & 1) == 1 and not compare
+        cin = 1 if compare else carry_in
+        addend = (~input2 & 0xFF) if sub else input2
+
+        res_lo = (input1 & 0x0F) + (addend & 0x0F) + cin
+        half_carry = (res_lo >> 4) | (_BCD_CARRY[res_lo & 0x0F] if decimal else 0)
+        res_hi = (input1 >> 4) + (addend >> 4) + half_carry
+        carry_out = (res_hi >> 4) | (_BCD_CARRY[res_hi & 0x0F] if decimal else 0)
+        carry_7 = (((input1 >> 4) & 0x07) + ((addend >> 4) & 0x07) + half_carry) >> 3
+        result = ((res_hi & 0x0F) << 4) | (res_lo & 0x0F)
+
+        if compare:
+            return result, set_flag(set_nz(sr, result), FLAG_C, carry_out ^ 1)
+
+        adj_lo = _BCD_ADJUST[half_carry | (sub << 1) | (decimal << 2)]
+        adj_hi = _BCD_ADJUST[carry_out | (sub << 1) | (decimal << 2)]
+        output = ((((res_hi & 0x0F) + adj_hi) & 0x0F) << 4) | (((res_lo & 0x0F) + adj_lo) & 0x0F)
+
+        sr = set_nz(sr, result)
+        sr = set_flag(sr, FLAG_V, carry_7 ^ carry_out)
+        sr = set_flag(sr, FLAG_C, carry_out)
+        return output, sr
+
+    if func == ALU8Func.INC:
+        output = (input1 + 1) & 0xFF
+        return output, set_nz(sr, output)
+
+    if func == ALU8Func.DEC:
+        output = (input1 - 1) & 0xFF
+        return output, set_nz(sr, output)
+
+    if func == ALU8Func.ORA:
+        output = input1 | input2
+        return output, set_nz(sr, output)
+
+    if func == ALU8Func.AND:
+        output = input1 & input2
+        return output, set_nz(sr, output)
+
+    if func == ALU8Func.EOR:
+        output = input1 ^ input2
+        return output, set_nz(sr, output)
+
+    if func == ALU8Func.ASL or func == ALU8Func.ROL:
+        fill = carry_in if func == ALU8Func.ROL else 0
+        output = ((input1 << 1) | fill) & 0xFF
+        return output, set_flag(set_nz(sr, output), FLAG_C, input1 >> 7)
+
+    if func == ALU8Func.LSR or func == ALU8Func.ROR:
+        fill = carry_in if func == ALU8Func.ROR else 0
+        output = (input1 >> 1) | (fill << 7)
+        return output, set_flag(set_nz(sr, output), FLAG_C, input1 & 1)
+
+    return 0, sr
+
+
+@njit(cache=True)
+def read16(mem, addr: int) -> int:
+    return int64(mem[addr & 0xFFFF]) | (int64(mem[(addr + 1) & 0xFFFF]) << 8)
+
+
+@njit(cache=True)
+def read16_zp(mem, zp: int) -> int:
+    """Reads a pointer from the zero page, wrapping within the page."""
+    return int64(mem[zp & 0xFF]) | (int64(mem[(zp + 1) & 0xFF]) << 8)
+
+
+@njit(cache=True)
+def crossed(base: int, index: int) -> int:
+    return ((base & 0xFF) + index) >> 8
+
+
+@njit(cache=True)
+def step(state, mem, rom) -> int:
+    """Executes the instruction at PC and returns the number of cycles
+    it takes, including the opcode fetch."""
+    a = int(state[A])
+    x = int(state[X])
+    y = int(state[Y])
+    sp = int(state[SP])
+    pc = int(state[PC])
+    sr = int(state[SR])
+
+    opcode = int64(mem[pc])
+    pc = (pc + 1) & 0xFFFF
+    entry = int(rom[opcode])
+    handler = entry & 0xFF
+    func = (entry >> 8) & 0xFF
+    store = (entry >> 16) & 1
+    mode = (opcode >> 2) & 0x07
+    operand = int64(mem[pc])
+
+    cycles = 2
+    addr = 0
+    value = 0
+
+    if handler == Handler.BRK:
+        ret = (pc + 1) & 0xFFFF
+        mem[0x100 | sp] = ret >> 8
+        mem[0x100 | ((sp - 1) & 0xFF)] = ret & 0xFF
+        mem[0x100 | ((sp - 2) & 0xFF)] = sr | 0x30
+        sp = (sp - 3) & 0xFF
+        sr = set_flag(sr, FLAG_I, 1)
+        pc = read16(mem, 0xFFFE)
+        cycles = 7
+
+    elif handler == Handler.RTI:
+        sr = int64(mem[0x100 | ((sp + 1) & 0xFF)])
+        pc = int64(mem[0x100 | ((sp + 2) & 0xFF)]) | (int64(mem[0x100 | ((sp + 3) & 0xFF)]) << 8)
+        sp = (sp + 3) & 0xFF
+        cycles = 6
+
+    elif handler == Handler.FLAG:
+        sr = set_flag(sr, _FLAG_BIT[func], _FLAG_VALUE[func])
+
+    elif handler == Handler.JMP:
+        target = read16(mem, pc)
+        if opcode & 0x20:
+            # the pointer high byte is read from the same page
+            pc = int64(mem[target]) | (int64(mem[(target & 0xFF00) | ((target + 1) & 0xFF)]) << 8)
+            cycles = 5
+        else:
+            pc = target
+            cycles = 3
+
+    elif handler == Handler.BR:
+        flag = (FLAG_N, FLAG_V, FLAG_C, FLAG_Z)[opcode >> 6]
+        pc = (pc + 1) & 0xFFFF
+        if ((sr >> flag) & 1) == ((opcode >> 5) & 1):
+            offset = operand - 0x100 if operand & 0x80 else operand
+            target = (pc + offset) & 0xFFFF
+            cycles = 4 if (target ^ pc) & 0xFF00 else 3
+            pc = target
+
+    elif handler == Handler.JSR:
+        ret = (pc + 1) & 0xFFFF
+        mem[0x100 | sp] = ret >> 8
+        mem[0x100 | ((sp - 1) & 0xFF)] = ret & 0xFF
+        sp = (sp - 2) & 0xFF
+        pc = read16(mem, pc)
+        cycles = 6
+
+    elif handler == Handler.RTS:
+        pc = int64(mem[0x100 | ((sp + 1) & 0xFF)]) | (int64(mem[0x100 | ((sp + 2) & 0xFF)]) << 8)
+        sp = (sp + 2) & 0xFF
+        cycles = 6
+
+    elif handler == Handler.PHA or handler == Handler.PHP:
+        mem[0x100 | sp] = a if handler == Handler.PHA else sr
+        sp = (sp - 1) & 0xFF
+        cycles = 3
+
+    elif handler == Handler.PLA or handler == Handler.PLP:
+        sp = (sp + 1) & 0xFF
+        value = int64(mem[0x100 | sp])
+        if handler == Handler.PLA:
+            a, sr = alu(func, 0, value, sr)
+        else:
+            sr = value
+        cycles = 4
+
+    elif handler == Handler.TAX:
+        x, sr = alu(func, x, a, sr)
+    elif handler == Handler.TAY:
+        y, sr = alu(func, y, a, sr)
+    elif handler == Handler.TSX:
+        x, sr = alu(func, x, sp, sr)
+    elif handler == Handler.TXA:
+        a, sr = alu(func, a, x, sr)
+    elif handler == Handler.TXS:
+        sp, sr = alu(func, sp, x, sr)
+    elif handler == Handler.TYA:
+        a, sr = alu(func, a, y, sr)
+
+    elif handler == Handler.INC_DEC_X:
+        x, sr = alu(func, x, 0, sr)
+    elif handler == Handler.INC_DEC_Y:
+        y, sr = alu(func, y, 0, sr)
+
+    elif handler == Handler.STA or handler == Handler.STX or handler == Handler.STY:
+        if handler == Handler.STA:
+            src, index = a, x
+        elif handler == Handler.STX:
+            src, index = x, y
+        else:
+            src, index = y, x
+
+        pc = (pc + 1) & 0xFFFF
+        if mode == AddressModes.ZEROPAGE:
+            addr = operand
+            cycles = 3
+        elif mode == AddressModes.ZEROPAGE_IND:
+            addr = (operand + index) & 0xFF
+            cycles = 4
+        elif mode == AddressModes.ABSOLUTE:
+            addr = read16(mem, pc - 1)
+            pc = (pc + 1) & 0xFFFF
+            cycles = 4
+        elif mode == AddressModes.ABSOLUTE_X or mode == AddressModes.ABSOLUTE_Y:
+            index = x if mode == AddressModes.ABSOLUTE_X else y
+            addr = (read16(mem, pc - 1) + index) & 0xFFFF
+            pc = (pc + 1) & 0xFFFF
+            cycles = 5
+        elif mode == AddressModes.INDIRECT_X:
+            addr = read16_zp(mem, operand + x)
+            cycles = 6
+        else:
+            addr = (read16_zp(mem, operand) + y) & 0xFFFF
+            cycles = 6
+        mem[addr] = src
+
+    elif handler == Handler.ALU2:
+        if mode == AddressModes.IMMEDIATE:
+            a, sr = alu(func, a, 0, sr)
+        else:
+            pc = (pc + 1) & 0xFFFF
+            if mode == AddressModes.ZEROPAGE:
+                addr = operand
+                cycles = 5
+            elif mode == AddressModes.ZEROPAGE_IND:
+                addr = (operand + x) & 0xFF
+                cycles = 6
+            elif mode == AddressModes.ABSOLUTE:
+                addr = read16(mem, pc - 1)
+                pc = (pc + 1) & 0xFFFF
+                cycles = 6
+            else:
+                addr = (read16(mem, pc - 1) + x) & 0xFFFF
+                pc = (pc + 1) & 0xFFFF
+                cycles = 7
+            value, sr = alu(func, int64(mem[addr]), 0, sr)
+            mem[addr] = value
+
+    elif (handler == Handler.ALU_IMP_X or handler == Handler.ALU_IMP_Y or
+          handler == Handler.ALU_A or handler == Handler.ALU_X or handler == Handler.ALU_Y):
+        if handler == Handler.ALU_A:
+            output, x_index = a, x
+        elif handler == Handler.ALU_X or handler == Handler.ALU_IMP_X:
+            output, x_index = x, y
+        else:
+            output, x_index = y, x
+
+        if handler == Handler.ALU_IMP_X or handler == Handler.ALU_IMP_Y:
+            mode = AddressModes.IMMEDIATE
+
+        pc = (pc + 1) & 0xFFFF
+        if mode == AddressModes.IMMEDIATE:
+            value = operand
+        elif mode == AddressModes.ZEROPAGE:
+            value = int64(mem[operand])
+            cycles = 3
+        elif mode == AddressModes.ZEROPAGE_IND:
+            value = int64(mem[(operand + x_index) & 0xFF])
+            cycles = 4
+        elif mode == AddressModes.ABSOLUTE:
+            value = int64(mem[read16(mem, pc - 1)])
+            pc = (pc + 1) & 0xFFFF
+            cycles = 4
+        elif mode == AddressModes.ABSOLUTE_X or mode == AddressModes.ABSOLUTE_Y:
+            index = x_index if mode == AddressModes.ABSOLUTE_X else y
+            base = read16(mem, pc - 1)
+            value = int64(mem[(base + index) & 0xFFFF])
+            pc = (pc + 1) & 0xFFFF
+            cycles = 4 + crossed(base, index)
+        elif mode == AddressModes.INDIRECT_X:
+            value = int64(mem[read16_zp(mem, operand + x)])
+            cycles = 6
+        else:
+            base = read16_zp(mem, operand)
+            value = int64(mem[(base + y) & 0xFFFF])
+            cycles = 5 + crossed(base, y)
+
+        result, sr = alu(func, output, value, sr)
+        if store:
+            if handler == Handler.ALU_A:
+                a = result
+            elif handler == Handler.ALU_X or handler == Handler.ALU_IMP_X:
+                x = result
+            else:
+                y = result
+
+    # NOP and illegal opcodes take two cycles and do nothing
+
+    state[A] = a
+    state[X] = x
+    state[Y] = y
+    state[SP] = sp
+    state[PC] = pc & 0xFFFF
+    state[SR] = sr
+    return cycles
+
+
+@njit(cache=True)
+def run(state, mem, rom, instructions: int) -> int:
+    """Executes the given number of instructions and returns the
+    number of cycles they take."""
+    cycles = 0
+    for _ in range(instructions):
+        cycles += step(state, mem, rom)
+    return cycles